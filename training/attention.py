@@ -0,0 +1,27 @@
+"""
+Attention backend choice shared by the training and inference scripts.
+
+Every script that loads a model passes pick_attn_implementation() to
+from_pretrained, so the FlashAttention-2 / SDPA policy lives here only.
+"""
+
+import importlib.util
+
+import torch
+
+
+def pick_attn_implementation(static_cache: bool = False) -> str:
+    """
+    FlashAttention-2 when flash-attn is installed and CUDA is up, else
+    PyTorch SDPA.
+
+    static_cache: the model will generate with a static KV cache (the
+    --compile paths). transformers' FA2 path rejects a static cache, or
+    attends over its unfilled slots, in the versions requirements.txt
+    allows, so SDPA is used then.
+    """
+    if static_cache:
+        return "sdpa"
+    if torch.cuda.is_available() and importlib.util.find_spec("flash_attn") is not None:
+        return "flash_attention_2"
+    return "sdpa"
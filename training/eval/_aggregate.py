@@ -0,0 +1,22 @@
+"""
+Batch aggregation shared by the evaluation metrics.
+"""
+
+from operator import attrgetter
+
+import numpy as np
+
+
+def mean_scores(results: list, fields: tuple[str, ...]) -> list[float]:
+    """
+    Average each of `fields` over `results`, rounded to 3 places.
+
+    Scores are stacked into one (n, k) float64 array and reduced in a
+    single pass instead of one Python sum() per field.
+    """
+    scores = np.fromiter(
+        map(attrgetter(*fields), results),
+        dtype=np.dtype((np.float64, len(fields))),
+        count=len(results),
+    )
+    return [round(float(mean), 3) for mean in scores.mean(axis=0)]
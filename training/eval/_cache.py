@@ -0,0 +1,46 @@
+"""
+Per-response memo shared by the evaluation metrics.
+
+The constraint, diversity and premium metrics all start from the same
+facts about a response: its (name, tld) pairs, the bare names, their
+lengths, their TLDs and the characters they use. prepare() derives those
+once per response and caches them, so re-scoring the same samples (several
+metrics in a row, or repeated sweeps over a split) parses each response
+exactly once.
+"""
+
+from collections import Counter
+from collections.abc import Mapping
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+
+from ._parse import parse_domains
+
+
+@dataclass(frozen=True)
+class PreparsedSample:
+    """Parsed view of one model response."""
+    domains: tuple[tuple[str, str], ...]  # (name, tld) pairs, lowercase
+    names: tuple[str, ...]                # Names without TLD
+    sorted_lengths: tuple[int, ...]       # Name lengths, ascending
+    tld_counts: Mapping[str, int]         # Domains per TLD (read-only view)
+    chars: frozenset[str]                 # Distinct characters across names
+
+
+# Keyed on the response string itself: str caches its own hash, so a hit
+# costs less than re-hashing the content with blake2b would. Sized to hold
+# a full 10k test/val split.
+@lru_cache(maxsize=16384)
+def prepare(response: str) -> PreparsedSample:
+    """Parse a response once and cache the result."""
+    domains = parse_domains(response)
+    names = tuple(name for name, _ in domains)
+    return PreparsedSample(
+        domains=domains,
+        names=names,
+        sorted_lengths=tuple(sorted(map(len, names))),
+        # Cached and shared by every metric: expose a read-only view
+        tld_counts=MappingProxyType(Counter(tld for _, tld in domains)),
+        chars=frozenset(''.join(names)),
+    )
@@ -0,0 +1,38 @@
+"""
+Process-pool fan-out for evaluate_batch.
+
+Scoring is pure-Python and GIL-bound, and samples are independent, so
+large batches are split across processes. Small batches stay serial:
+process start-up and pickling samples back and forth cost more than the
+scoring itself.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+# Below this many samples the pool overhead outweighs the speedup
+MIN_PARALLEL_SAMPLES = 20000
+
+
+def map_samples(fn: Callable[[dict], T], samples: list[dict], workers: int | None = None) -> list[T]:
+    """
+    Apply `fn` to every sample and return the results in order.
+
+    `fn` must be a module-level function so it can be pickled.
+    workers=None uses one process per CPU for batches of at least
+    MIN_PARALLEL_SAMPLES and runs serially otherwise; workers=1 forces
+    serial execution.
+    """
+    if workers is None:
+        workers = (os.cpu_count() or 1) if len(samples) >= MIN_PARALLEL_SAMPLES else 1
+
+    if workers <= 1 or len(samples) < 2:
+        return [fn(sample) for sample in samples]
+
+    # ~4 chunks per worker balances load without per-sample IPC
+    chunksize = max(1, len(samples) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fn, samples, chunksize=chunksize))
@@ -10,12 +10,31 @@ Measures how well generated domain names follow the constraints in the prompt:
 """
 
 import re
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
+from functools import lru_cache
+
+from ._aggregate import mean_scores
+from ._cache import PreparsedSample, prepare
+from ._parallel import map_samples
+
+
+# Compiled once at import; these run for every sample in evaluate_batch
+LENGTH_RE = re.compile(r'length\s*(\d+)\s*-\s*(\d+)')
+TLD_LIST_RE = re.compile(r'use tlds?:\s*([^.]*(?:\.[a-z]+[,\s]*)+)')
+TLD_RE = re.compile(r'\.([a-z]+)')
+COUNT_RE = re.compile(r'generate\s+(\d+)')
+MUST_INCLUDE_RE = re.compile(r'must include\s*["\']([^"\']+)["\']')
+MUST_START_RE = re.compile(r'must start with\s*["\']([^"\']+)["\']')
+MUST_END_RE = re.compile(r'must end with\s*["\']([^"\']+)["\']')
 
 
 @dataclass
 class ConstraintResult:
-    """Result of constraint satisfaction check."""
+    """Result of constraint satisfaction check.
+
+    Scores are kept unrounded; to_dict() rounds them to 3 places.
+    """
     length_satisfied: float      # 0.0 - 1.0
     tld_satisfied: float         # 0.0 - 1.0
     prefix_suffix_satisfied: float  # 0.0 - 1.0
@@ -24,11 +43,11 @@ class ConstraintResult:
 
     def to_dict(self) -> dict:
         return {
-            "length_satisfied": self.length_satisfied,
-            "tld_satisfied": self.tld_satisfied,
-            "prefix_suffix_satisfied": self.prefix_suffix_satisfied,
-            "count_satisfied": self.count_satisfied,
-            "overall": self.overall,
+            "length_satisfied": round(self.length_satisfied, 3),
+            "tld_satisfied": round(self.tld_satisfied, 3),
+            "prefix_suffix_satisfied": round(self.prefix_suffix_satisfied, 3),
+            "count_satisfied": round(self.count_satisfied, 3),
+            "overall": round(self.overall, 3),
         }
 
 
@@ -40,97 +59,153 @@ def parse_domains_from_response(response: str) -> list[tuple[str, str]]:
     Example response:
     "- slnovai.com — Compact brand feel with technical vibe"
     """
-    domains = []
-
-    # Pattern: domain.tld followed by space or dash
-    pattern = r'([a-z0-9-]+)\.([a-z]{2,10})\s*[—\-–]'
-
-    for match in re.finditer(pattern, response.lower()):
-        name = match.group(1)
-        tld = match.group(2)
-        domains.append((name, tld))
-
-    return domains
+    return list(prepare(response).domains)
 
 
+# Prompts come from a handful of templates and are re-scored across metrics
+# and runs, so each extract_* parses a given prompt once
+@lru_cache(maxsize=2048)
 def extract_length_constraint(prompt: str) -> tuple[int, int] | None:
     """Extract length constraint from prompt (e.g., 'Length 4-10')."""
-    match = re.search(r'length\s*(\d+)\s*-\s*(\d+)', prompt.lower())
+    match = LENGTH_RE.search(prompt.lower())
     if match:
         return int(match.group(1)), int(match.group(2))
     return None
 
 
-def extract_tld_constraint(prompt: str) -> list[str] | None:
+@lru_cache(maxsize=2048)
+def extract_tld_constraint(prompt: str) -> tuple[str, ...] | None:
     """Extract TLD constraint from prompt (e.g., 'Use TLDs: .com, .io')."""
-    match = re.search(r'use tlds?:\s*([^.]*(?:\.[a-z]+[,\s]*)+)', prompt.lower())
+    match = TLD_LIST_RE.search(prompt.lower())
     if match:
         tld_str = match.group(1)
-        tlds = re.findall(r'\.([a-z]+)', tld_str)
-        return tlds
+        # Tuple, not list: the result is cached and shared between callers
+        return tuple(TLD_RE.findall(tld_str))
     return None
 
 
+@lru_cache(maxsize=2048)
 def extract_count_constraint(prompt: str) -> int | None:
     """Extract count constraint from prompt (e.g., 'Generate 6 names')."""
-    match = re.search(r'generate\s+(\d+)', prompt.lower())
+    match = COUNT_RE.search(prompt.lower())
     if match:
         return int(match.group(1))
     return None
 
 
+@lru_cache(maxsize=2048)
 def extract_prefix_suffix_constraint(prompt: str) -> tuple[str | None, str | None]:
     """Extract prefix/suffix constraint (e.g., 'Must include "nova"')."""
     prefix = None
     suffix = None
+    prompt = prompt.lower()
 
     # Must include
-    match = re.search(r'must include\s*["\']([^"\']+)["\']', prompt.lower())
+    match = MUST_INCLUDE_RE.search(prompt)
     if match:
         prefix = match.group(1)  # Could be prefix, suffix, or anywhere
 
     # Must start with
-    match = re.search(r'must start with\s*["\']([^"\']+)["\']', prompt.lower())
+    match = MUST_START_RE.search(prompt)
     if match:
         prefix = match.group(1)
 
     # Must end with
-    match = re.search(r'must end with\s*["\']([^"\']+)["\']', prompt.lower())
+    match = MUST_END_RE.search(prompt)
     if match:
         suffix = match.group(1)
 
     return prefix, suffix
 
 
-def check_constraints(prompt: str, response: str) -> ConstraintResult:
+def check_constraints(
+    prompt: str,
+    response: str,
+    prompt_meta: dict | None = None,
+) -> ConstraintResult:
     """
     Check how well the response satisfies prompt constraints.
     Returns scores from 0.0 (failed) to 1.0 (fully satisfied).
+
+    prompt_meta optionally carries the constraints the prompt was generated
+    from, so they don't have to be parsed back out of the prose:
+        {"length": (4, 10), "tlds": ["com", "io"], "count": 6,
+         "must_include": "nova", "must_end": "ly"}
+    Any key that is missing falls back to parsing the prompt;
+    must_include/must_end are taken as a pair.
     """
-    domains = parse_domains_from_response(response)
+    return check_constraints_from_parsed(prompt, prepare(response), prompt_meta)
+
+
+def _constraints(prompt: str, prompt_meta: dict | None) -> tuple:
+    """Resolve (length, tlds, (prefix, suffix), count) from meta or prompt."""
+    if not prompt_meta:
+        return (
+            extract_length_constraint(prompt),
+            extract_tld_constraint(prompt),
+            extract_prefix_suffix_constraint(prompt),
+            extract_count_constraint(prompt),
+        )
+
+    if "length" in prompt_meta:
+        length = prompt_meta["length"]
+    else:
+        length = extract_length_constraint(prompt)
+
+    if "tlds" in prompt_meta:
+        # Accept ".com" as well as "com", matching how the dataset stores TLDs
+        tlds = tuple(tld.lstrip(".").lower() for tld in prompt_meta["tlds"])
+    else:
+        tlds = extract_tld_constraint(prompt)
 
+    if "must_include" in prompt_meta or "must_end" in prompt_meta:
+        prefix_suffix = (prompt_meta.get("must_include"), prompt_meta.get("must_end"))
+    else:
+        prefix_suffix = extract_prefix_suffix_constraint(prompt)
+
+    if "count" in prompt_meta:
+        count = prompt_meta["count"]
+    else:
+        count = extract_count_constraint(prompt)
+
+    return length, tlds, prefix_suffix, count
+
+
+def check_constraints_from_parsed(
+    prompt: str,
+    parsed: PreparsedSample,
+    prompt_meta: dict | None = None,
+) -> ConstraintResult:
+    """
+    Same as check_constraints, for a response already run through prepare().
+    """
+    domains = parsed.domains
     if not domains:
         return ConstraintResult(0.0, 0.0, 0.0, 0.0, 0.0)
 
+    length_constraint, tld_constraint, (prefix, suffix), count_constraint = (
+        _constraints(prompt, prompt_meta)
+    )
+
     # Length constraint
-    length_constraint = extract_length_constraint(prompt)
     if length_constraint:
         min_len, max_len = length_constraint
-        length_ok = sum(1 for name, _ in domains if min_len <= len(name) <= max_len)
+        # Range count over the pre-sorted lengths instead of testing each name
+        lengths = parsed.sorted_lengths
+        length_ok = max(0, bisect_right(lengths, max_len) - bisect_left(lengths, min_len))
         length_satisfied = length_ok / len(domains)
     else:
         length_satisfied = 1.0  # No constraint = satisfied
 
     # TLD constraint
-    tld_constraint = extract_tld_constraint(prompt)
     if tld_constraint:
-        tld_ok = sum(1 for _, tld in domains if tld in tld_constraint)
+        # One lookup per allowed TLD instead of a list scan per domain
+        tld_ok = sum(parsed.tld_counts.get(tld, 0) for tld in set(tld_constraint))
         tld_satisfied = tld_ok / len(domains)
     else:
         tld_satisfied = 1.0
 
     # Prefix/suffix constraint
-    prefix, suffix = extract_prefix_suffix_constraint(prompt)
     if prefix or suffix:
         ps_ok = 0
         for name, _ in domains:
@@ -145,53 +220,61 @@ def check_constraints(prompt: str, response: str) -> ConstraintResult:
         prefix_suffix_satisfied = 1.0
 
     # Count constraint
-    count_constraint = extract_count_constraint(prompt)
     if count_constraint:
-        # Allow some flexibility: 80-120% of target count
+        # Allow some flexibility: 80-120% of target count. Below 80% the
+        # ratio/0.8 term is the smallest, above 120% the 1.2/ratio term is,
+        # and in between both are >= 1.0 (ratio > 0: domains is non-empty)
         ratio = len(domains) / count_constraint
-        if 0.8 <= ratio <= 1.2:
-            count_satisfied = 1.0
-        elif ratio < 0.8:
-            count_satisfied = ratio / 0.8
-        else:  # ratio > 1.2
-            count_satisfied = 1.2 / ratio
+        count_satisfied = min(1.0, ratio / 0.8, 1.2 / ratio)
     else:
         count_satisfied = 1.0
 
     overall = (length_satisfied + tld_satisfied + prefix_suffix_satisfied + count_satisfied) / 4
 
     return ConstraintResult(
-        length_satisfied=round(length_satisfied, 3),
-        tld_satisfied=round(tld_satisfied, 3),
-        prefix_suffix_satisfied=round(prefix_suffix_satisfied, 3),
-        count_satisfied=round(count_satisfied, 3),
-        overall=round(overall, 3),
+        length_satisfied=length_satisfied,
+        tld_satisfied=tld_satisfied,
+        prefix_suffix_satisfied=prefix_suffix_satisfied,
+        count_satisfied=count_satisfied,
+        overall=overall,
+    )
+
+
+def _score_sample(sample: dict) -> ConstraintResult:
+    return check_constraints_from_parsed(
+        sample['prompt'], prepare(sample['response']), sample.get('prompt_meta'),
     )
 
 
-def evaluate_batch(samples: list[dict]) -> dict:
+def evaluate_batch(samples: list[dict], workers: int | None = None) -> dict:
     """
     Evaluate constraint satisfaction for a batch of samples.
 
-    Each sample should have 'prompt' and 'response' keys.
+    Each sample should have 'prompt' and 'response' keys, and may have a
+    'prompt_meta' dict (see check_constraints).
+
+    `workers` is passed to map_samples(): None picks serial or one process
+    per CPU based on batch size, 1 forces serial.
     """
-    results = []
-    for sample in samples:
-        result = check_constraints(sample['prompt'], sample['response'])
-        results.append(result)
+    results = map_samples(_score_sample, samples, workers)
 
     # Aggregate
     n = len(results)
     if n == 0:
         return {"error": "No samples to evaluate"}
 
+    fields = (
+        "length_satisfied",
+        "tld_satisfied",
+        "prefix_suffix_satisfied",
+        "count_satisfied",
+        "overall",
+    )
+    means = mean_scores(results, fields)
+
     return {
         "num_samples": n,
-        "avg_length_satisfied": round(sum(r.length_satisfied for r in results) / n, 3),
-        "avg_tld_satisfied": round(sum(r.tld_satisfied for r in results) / n, 3),
-        "avg_prefix_suffix_satisfied": round(sum(r.prefix_suffix_satisfied for r in results) / n, 3),
-        "avg_count_satisfied": round(sum(r.count_satisfied for r in results) / n, 3),
-        "avg_overall": round(sum(r.overall for r in results) / n, 3),
+        **{f"avg_{field}": mean for field, mean in zip(fields, means)},
     }
 
 
@@ -207,8 +290,8 @@ if __name__ == "__main__":
 
     result = check_constraints(test_prompt, test_response)
     print("Constraint Satisfaction Test:")
-    print(f"  Length: {result.length_satisfied}")
-    print(f"  TLD: {result.tld_satisfied}")
-    print(f"  Prefix/Suffix: {result.prefix_suffix_satisfied}")
-    print(f"  Count: {result.count_satisfied}")
-    print(f"  Overall: {result.overall}")
+    print(f"  Length: {result.length_satisfied:.3f}")
+    print(f"  TLD: {result.tld_satisfied:.3f}")
+    print(f"  Prefix/Suffix: {result.prefix_suffix_satisfied:.3f}")
+    print(f"  Count: {result.count_satisfied:.3f}")
+    print(f"  Overall: {result.overall:.3f}")
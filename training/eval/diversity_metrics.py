@@ -9,14 +9,20 @@ Measures variety and uniqueness of generated domain names:
 - Character diversity: Variety of characters used
 """
 
-import re
 from collections import Counter
 from dataclasses import dataclass
 
+from ._aggregate import mean_scores
+from ._cache import PreparsedSample, prepare
+from ._parallel import map_samples
+
 
 @dataclass
 class DiversityResult:
-    """Result of diversity analysis."""
+    """Result of diversity analysis.
+
+    Scores are kept unrounded; to_dict() rounds them to 3 places.
+    """
     type_token_ratio: float      # 0.0 - 1.0 (higher = more diverse)
     duplicate_rate: float        # 0.0 - 1.0 (lower = better)
     char_diversity: float        # 0.0 - 1.0 (higher = more varied chars)
@@ -26,19 +32,18 @@ class DiversityResult:
 
     def to_dict(self) -> dict:
         return {
-            "type_token_ratio": self.type_token_ratio,
-            "duplicate_rate": self.duplicate_rate,
-            "char_diversity": self.char_diversity,
-            "prefix_diversity": self.prefix_diversity,
-            "suffix_diversity": self.suffix_diversity,
-            "overall": self.overall,
+            "type_token_ratio": round(self.type_token_ratio, 3),
+            "duplicate_rate": round(self.duplicate_rate, 3),
+            "char_diversity": round(self.char_diversity, 3),
+            "prefix_diversity": round(self.prefix_diversity, 3),
+            "suffix_diversity": round(self.suffix_diversity, 3),
+            "overall": round(self.overall, 3),
         }
 
 
 def parse_domain_names(response: str) -> list[str]:
     """Extract just the domain names (without TLD) from response."""
-    pattern = r'([a-z0-9-]+)\.[a-z]{2,10}\s*[—\-–]'
-    return [match.group(1) for match in re.finditer(pattern, response.lower())]
+    return list(prepare(response).names)
 
 
 def calculate_ttr(names: list[str]) -> float:
@@ -49,17 +54,14 @@ def calculate_ttr(names: list[str]) -> float:
     if not names:
         return 0.0
 
-    # Split names into character n-grams (3-grams)
-    all_ngrams = []
-    for name in names:
-        ngrams = [name[i:i+3] for i in range(len(name) - 2)]
-        all_ngrams.extend(ngrams)
+    # Character n-grams (3-grams): count them arithmetically and only
+    # materialize the unique set
+    total = sum(len(name) - 2 for name in names if len(name) > 2)
 
-    if not all_ngrams:
+    if not total:
         return 1.0  # Single char names = unique by default
 
-    unique = len(set(all_ngrams))
-    total = len(all_ngrams)
+    unique = len({name[i:i+3] for name in names for i in range(len(name) - 2)})
 
     return unique / total
 
@@ -84,12 +86,14 @@ def calculate_char_diversity(names: list[str]) -> float:
     if not names:
         return 0.0
 
-    all_chars = ''.join(names)
-    if not all_chars:
-        return 0.0
+    # Only the number of distinct characters matters, not their counts
+    return _char_diversity_score(len(set(''.join(names))))
 
-    char_counts = Counter(all_chars)
-    unique_chars = len(char_counts)
+
+def _char_diversity_score(unique_chars: int) -> float:
+    """Score a distinct-character count against the a-z + 0-9 alphabet."""
+    if not unique_chars:
+        return 0.0
 
     # Ideal: all 26 letters + 10 digits used somewhat evenly
     # Score based on how many unique chars used
@@ -97,85 +101,124 @@ def calculate_char_diversity(names: list[str]) -> float:
     return min(unique_chars / max_possible, 1.0)
 
 
-def calculate_prefix_diversity(names: list[str], prefix_len: int = 2) -> float:
-    """Measure diversity of name beginnings."""
-    if not names:
+def _unique_ratio(items: list[str]) -> float:
+    """Fraction of distinct items; 0.0 for an empty list."""
+    if not items:
         return 0.0
+    return len(set(items)) / len(items)
 
-    prefixes = [name[:prefix_len] for name in names if len(name) >= prefix_len]
-    if not prefixes:
-        return 0.0
-
-    unique = len(set(prefixes))
-    total = len(prefixes)
 
-    return unique / total
+def calculate_prefix_diversity(names: list[str], prefix_len: int = 2) -> float:
+    """Measure diversity of name beginnings."""
+    return _unique_ratio([name[:prefix_len] for name in names if len(name) >= prefix_len])
 
 
 def calculate_suffix_diversity(names: list[str], suffix_len: int = 2) -> float:
     """Measure diversity of name endings."""
-    if not names:
-        return 0.0
+    return _unique_ratio([name[-suffix_len:] for name in names if len(name) >= suffix_len])
 
-    suffixes = [name[-suffix_len:] for name in names if len(name) >= suffix_len]
-    if not suffixes:
-        return 0.0
 
-    unique = len(set(suffixes))
-    total = len(suffixes)
+def _affix_diversity(names: tuple[str, ...], affix_len: int = 2) -> tuple[float, float]:
+    """
+    Prefix and suffix diversity from one pass over `names`.
 
-    return unique / total
+    Same results as calculate_prefix_diversity/calculate_suffix_diversity,
+    with one length check per name instead of two comprehensions.
+    """
+    prefixes = []
+    suffixes = []
+    for name in names:
+        if len(name) >= affix_len:
+            prefixes.append(name[:affix_len])
+            suffixes.append(name[-affix_len:])
+    return _unique_ratio(prefixes), _unique_ratio(suffixes)
 
 
 def check_diversity(response: str) -> DiversityResult:
     """
     Analyze diversity of generated domain names in a response.
     """
-    names = parse_domain_names(response)
+    return check_diversity_from_parsed(prepare(response))
 
+
+def check_diversity_from_parsed(parsed: PreparsedSample) -> DiversityResult:
+    """
+    Same as check_diversity, for a response already run through prepare().
+    """
+    names = parsed.names
     if not names:
         return DiversityResult(0.0, 1.0, 0.0, 0.0, 0.0, 0.0)
 
     ttr = calculate_ttr(names)
     dup_rate = calculate_duplicate_rate(names)
-    char_div = calculate_char_diversity(names)
-    prefix_div = calculate_prefix_diversity(names)
-    suffix_div = calculate_suffix_diversity(names)
+    char_div = _char_diversity_score(len(parsed.chars))
+    prefix_div, suffix_div = _affix_diversity(names)
 
     # Overall score (dup_rate is inverted - lower is better)
     overall = (ttr + (1 - dup_rate) + char_div + prefix_div + suffix_div) / 5
 
     return DiversityResult(
-        type_token_ratio=round(ttr, 3),
-        duplicate_rate=round(dup_rate, 3),
-        char_diversity=round(char_div, 3),
-        prefix_diversity=round(prefix_div, 3),
-        suffix_diversity=round(suffix_div, 3),
-        overall=round(overall, 3),
+        type_token_ratio=ttr,
+        duplicate_rate=dup_rate,
+        char_diversity=char_div,
+        prefix_diversity=prefix_div,
+        suffix_diversity=suffix_div,
+        overall=overall,
     )
 
 
-def evaluate_batch(samples: list[dict]) -> dict:
+def _score_sample(sample: dict) -> DiversityResult:
+    return check_diversity_from_parsed(prepare(sample['response']))
+
+
+def _score_sample_with_names(sample: dict) -> tuple[DiversityResult, tuple[str, ...]]:
+    parsed = prepare(sample['response'])
+    return check_diversity_from_parsed(parsed), parsed.names
+
+
+def evaluate_batch(samples: list[dict], workers: int | None = None) -> dict:
     """
     Evaluate diversity for a batch of samples.
+
+    `workers` is passed to map_samples(): None picks serial or one process
+    per CPU based on batch size, 1 forces serial.
     """
-    results = []
-    for sample in samples:
-        result = check_diversity(sample['response'])
-        results.append(result)
+    return _summarize(map_samples(_score_sample, samples, workers))
+
 
+def evaluate_batch_with_names(samples: list[dict], workers: int | None = None) -> tuple[dict, list[str]]:
+    """
+    evaluate_batch(), plus every parsed name in sample order, ready for
+    evaluate_cross_batch_diversity().
+
+    Collecting the names while scoring parses each response once. A
+    separate parse_domain_names() pass afterwards re-parses everything when
+    the batch outgrows the prepare() cache or was scored in worker
+    processes.
+    """
+    scored = map_samples(_score_sample_with_names, samples, workers)
+    all_names = [name for _, names in scored for name in names]
+    return _summarize([result for result, _ in scored]), all_names
+
+
+def _summarize(results: list[DiversityResult]) -> dict:
     n = len(results)
     if n == 0:
         return {"error": "No samples to evaluate"}
 
+    fields = (
+        "type_token_ratio",
+        "duplicate_rate",
+        "char_diversity",
+        "prefix_diversity",
+        "suffix_diversity",
+        "overall",
+    )
+    means = mean_scores(results, fields)
+
     return {
         "num_samples": n,
-        "avg_type_token_ratio": round(sum(r.type_token_ratio for r in results) / n, 3),
-        "avg_duplicate_rate": round(sum(r.duplicate_rate for r in results) / n, 3),
-        "avg_char_diversity": round(sum(r.char_diversity for r in results) / n, 3),
-        "avg_prefix_diversity": round(sum(r.prefix_diversity for r in results) / n, 3),
-        "avg_suffix_diversity": round(sum(r.suffix_diversity for r in results) / n, 3),
-        "avg_overall": round(sum(r.overall for r in results) / n, 3),
+        **{f"avg_{field}": mean for field, mean in zip(fields, means)},
     }
 
 
@@ -187,24 +230,24 @@ def evaluate_cross_batch_diversity(all_names: list[str]) -> dict:
     if not all_names:
         return {"error": "No names to evaluate"}
 
-    # Most common names
+    # Most common names. most_common(n) is already a heapq.nlargest over
+    # the counts, not a full sort; the Counter's size is the unique count.
     name_counts = Counter(all_names)
     most_common = name_counts.most_common(10)
+    unique_names = len(name_counts)
 
     # Most common prefixes (3 chars)
-    prefixes = [n[:3] for n in all_names if len(n) >= 3]
-    prefix_counts = Counter(prefixes)
+    prefix_counts = Counter(n[:3] for n in all_names if len(n) >= 3)
     most_common_prefixes = prefix_counts.most_common(10)
 
     # Most common suffixes (3 chars)
-    suffixes = [n[-3:] for n in all_names if len(n) >= 3]
-    suffix_counts = Counter(suffixes)
+    suffix_counts = Counter(n[-3:] for n in all_names if len(n) >= 3)
     most_common_suffixes = suffix_counts.most_common(10)
 
     return {
         "total_names": len(all_names),
-        "unique_names": len(set(all_names)),
-        "unique_ratio": round(len(set(all_names)) / len(all_names), 3),
+        "unique_names": unique_names,
+        "unique_ratio": round(unique_names / len(all_names), 3),
         "most_common_names": most_common,
         "most_common_prefixes": most_common_prefixes,
         "most_common_suffixes": most_common_suffixes,
@@ -222,9 +265,9 @@ if __name__ == "__main__":
 
     result = check_diversity(test_response)
     print("Diversity Metrics Test:")
-    print(f"  Type-Token Ratio: {result.type_token_ratio}")
-    print(f"  Duplicate Rate: {result.duplicate_rate}")
-    print(f"  Char Diversity: {result.char_diversity}")
-    print(f"  Prefix Diversity: {result.prefix_diversity}")
-    print(f"  Suffix Diversity: {result.suffix_diversity}")
-    print(f"  Overall: {result.overall}")
+    print(f"  Type-Token Ratio: {result.type_token_ratio:.3f}")
+    print(f"  Duplicate Rate: {result.duplicate_rate:.3f}")
+    print(f"  Char Diversity: {result.char_diversity:.3f}")
+    print(f"  Prefix Diversity: {result.prefix_diversity:.3f}")
+    print(f"  Suffix Diversity: {result.suffix_diversity:.3f}")
+    print(f"  Overall: {result.overall:.3f}")
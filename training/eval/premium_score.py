@@ -13,6 +13,10 @@ Measures how valuable and brandable a domain name is:
 import re
 from dataclasses import dataclass
 
+from ._aggregate import mean_scores
+from ._cache import PreparsedSample, prepare
+from ._parallel import map_samples
+
 # Common English words that make good domain bases
 VALUABLE_WORDS = {
     'get', 'try', 'go', 'my', 'the', 'app', 'hub', 'lab', 'box', 'kit',
@@ -25,8 +29,8 @@ VALUABLE_WORDS = {
 
 # Valuable suffixes for tech/startup domains
 VALUABLE_SUFFIXES = {
-    'ly', 'ify', 'io', 'fy', 'er', 'fy', 'hub', 'lab', 'box', 'hq',
-    'ai', 'app', 'dev', 'pro', 'max', 'ify', 'able', 'ful',
+    'ly', 'ify', 'io', 'fy', 'er', 'hub', 'lab', 'box', 'hq',
+    'ai', 'app', 'dev', 'pro', 'max', 'able', 'ful',
 }
 
 # TLD value rankings
@@ -45,9 +49,33 @@ TLD_VALUES = {
 }
 
 
+def _longest_first(words: set[str]) -> tuple[str, ...]:
+    """
+    Order a word set longest first, then alphabetically. Set iteration
+    order changes with hash randomization; a fixed order keeps the
+    compiled patterns reproducible between runs.
+    """
+    return tuple(sorted(words, key=lambda w: (-len(w), w)))
+
+
+# Compiled once at import; these run for every domain in a batch
+VALUABLE_WORD_RE = re.compile('|'.join(map(re.escape, _longest_first(VALUABLE_WORDS))))
+VALUABLE_SUFFIX_TUPLE = _longest_first(VALUABLE_SUFFIXES)
+REPEATED_CHAR_RE = re.compile(r'(.)\1{2,}')
+UNUSUAL_RUN_RE = re.compile(r'[xzq]{2,}')
+
+# Character classes for memorability, as C-level set/bytes lookups
+MEMORABLE_VOWELS = frozenset('aeiou')
+EASY_CHARS = 'abcdefghijklmnoprstuvwy'
+HARD_TO_TYPE_BYTES = bytes(b for b in range(256) if chr(b) not in EASY_CHARS)
+
+
 @dataclass
 class PremiumResult:
-    """Result of premium/brandability analysis."""
+    """Result of premium/brandability analysis.
+
+    Scores are kept unrounded; to_dict() rounds them to 3 places.
+    """
     length_score: float          # 0.0 - 1.0 (shorter = higher)
     word_score: float            # 0.0 - 1.0 (contains valuable words)
     tld_score: float             # 0.0 - 1.0 (based on TLD value)
@@ -57,19 +85,18 @@ class PremiumResult:
 
     def to_dict(self) -> dict:
         return {
-            "length_score": self.length_score,
-            "word_score": self.word_score,
-            "tld_score": self.tld_score,
-            "pattern_score": self.pattern_score,
-            "memorability_score": self.memorability_score,
-            "overall": self.overall,
+            "length_score": round(self.length_score, 3),
+            "word_score": round(self.word_score, 3),
+            "tld_score": round(self.tld_score, 3),
+            "pattern_score": round(self.pattern_score, 3),
+            "memorability_score": round(self.memorability_score, 3),
+            "overall": round(self.overall, 3),
         }
 
 
 def parse_domains(response: str) -> list[tuple[str, str]]:
     """Extract (name, tld) pairs from response."""
-    pattern = r'([a-z0-9-]+)\.([a-z]{2,10})\s*[—\-–]'
-    return [(m.group(1), m.group(2)) for m in re.finditer(pattern, response.lower())]
+    return list(prepare(response).domains)
 
 
 def calculate_length_score(name: str) -> float:
@@ -98,22 +125,22 @@ def calculate_word_score(name: str) -> float:
     Score based on containing valuable words/patterns.
     """
     name_lower = name.lower()
+    return _word_score(name_lower, len(name_lower), name_lower.isalpha())
+
+
+def _word_score(name_lower: str, length: int, is_alpha: bool) -> float:
     score = 0.5  # Base score
 
-    # Check for valuable words
-    for word in VALUABLE_WORDS:
-        if word in name_lower:
-            score += 0.2
-            break
+    # Check for valuable words (one scan for all words)
+    if VALUABLE_WORD_RE.search(name_lower):
+        score += 0.2
 
     # Check for valuable suffixes
-    for suffix in VALUABLE_SUFFIXES:
-        if name_lower.endswith(suffix):
-            score += 0.15
-            break
+    if name_lower.endswith(VALUABLE_SUFFIX_TUPLE):
+        score += 0.15
 
     # Bonus for being a single dictionary-like word
-    if name_lower.isalpha() and len(name_lower) <= 8:
+    if is_alpha and length <= 8:
         score += 0.1
 
     return min(score, 1.0)
@@ -121,7 +148,11 @@ def calculate_word_score(name: str) -> float:
 
 def calculate_tld_score(tld: str) -> float:
     """Score based on TLD value."""
-    return TLD_VALUES.get(tld.lower(), 0.4)
+    score = TLD_VALUES.get(tld)
+    if score is None:
+        # Parsed TLDs are already lowercase; only raw input needs lowering
+        score = TLD_VALUES.get(tld.lower(), 0.4)
+    return score
 
 
 def calculate_pattern_score(name: str) -> float:
@@ -130,14 +161,18 @@ def calculate_pattern_score(name: str) -> float:
     Clean, simple patterns score higher.
     """
     name_lower = name.lower()
+    return _pattern_score(name_lower, name_lower.isalpha())
+
+
+def _pattern_score(name_lower: str, is_alpha: bool) -> float:
     score = 0.5
 
     # All letters (no numbers/hyphens) = bonus
-    if name_lower.isalpha():
+    if is_alpha:
         score += 0.2
 
     # No consecutive same letters
-    if not re.search(r'(.)\1{2,}', name_lower):
+    if not REPEATED_CHAR_RE.search(name_lower):
         score += 0.1
 
     # Starts with letter
@@ -156,37 +191,65 @@ def calculate_memorability_score(name: str) -> float:
     Score how memorable/typeable the name is.
     """
     name_lower = name.lower()
+    return _memorability_score(name_lower, len(name_lower))
+
+
+def _memorability_score(name_lower: str, length: int) -> float:
     score = 0.5
 
     # Short names are more memorable
-    if len(name_lower) <= 7:
+    if length <= 7:
         score += 0.2
 
     # Common letter patterns
-    if re.search(r'[aeiou]', name_lower):  # Has vowels
+    if not MEMORABLE_VOWELS.isdisjoint(name_lower):  # Has vowels
         score += 0.1
 
     # No unusual character sequences
-    if not re.search(r'[xzq]{2,}', name_lower):
+    if not UNUSUAL_RUN_RE.search(name_lower):
         score += 0.1
 
-    # Easy to type (no numbers, common letters)
-    easy_chars = set('abcdefghijklmnoprstuvwy')
-    char_ease = sum(1 for c in name_lower if c in easy_chars) / len(name_lower)
+    # Easy to type (no numbers, common letters): delete the hard-to-type
+    # bytes and count what is left
+    easy_count = len(name_lower.encode().translate(None, HARD_TO_TYPE_BYTES))
+    char_ease = easy_count / length
     score += char_ease * 0.1
 
     return min(score, 1.0)
 
 
+def _score_one(name: str, tld: str) -> tuple[float, float, float, float, float]:
+    """
+    Compute (length, word, tld, pattern, memorability) scores in one pass.
+
+    Uses the same per-criterion helpers as the calculate_* functions, but
+    the shared facts about the name (lowercase form, length, isalpha) are
+    derived once instead of once per scorer.
+    """
+    name_lower = name.lower()
+    length = len(name_lower)
+    is_alpha = name_lower.isalpha()
+
+    return (
+        calculate_length_score(name),
+        _word_score(name_lower, length, is_alpha),
+        calculate_tld_score(tld),
+        _pattern_score(name_lower, is_alpha),
+        _memorability_score(name_lower, length),
+    )
+
+
 def check_premium(name: str, tld: str) -> PremiumResult:
     """
     Analyze premium/brandability score of a domain.
     """
-    length_score = calculate_length_score(name)
-    word_score = calculate_word_score(name)
-    tld_score = calculate_tld_score(tld)
-    pattern_score = calculate_pattern_score(name)
-    memorability_score = calculate_memorability_score(name)
+    (
+        length_score,
+        word_score,
+        tld_score,
+        pattern_score,
+        memorability_score,
+    ) = _score_one(name, tld)
 
     # Weighted average
     overall = (
@@ -198,12 +261,12 @@ def check_premium(name: str, tld: str) -> PremiumResult:
     )
 
     return PremiumResult(
-        length_score=round(length_score, 3),
-        word_score=round(word_score, 3),
-        tld_score=round(tld_score, 3),
-        pattern_score=round(pattern_score, 3),
-        memorability_score=round(memorability_score, 3),
-        overall=round(overall, 3),
+        length_score=length_score,
+        word_score=word_score,
+        tld_score=tld_score,
+        pattern_score=pattern_score,
+        memorability_score=memorability_score,
+        overall=overall,
     )
 
 
@@ -211,8 +274,15 @@ def check_premium_response(response: str) -> PremiumResult:
     """
     Analyze premium score for all domains in a response.
     """
-    domains = parse_domains(response)
+    return check_premium_from_parsed(prepare(response))
 
+
+def check_premium_from_parsed(parsed: PreparsedSample) -> PremiumResult:
+    """
+    Same as check_premium_response, for a response already run through
+    prepare().
+    """
+    domains = parsed.domains
     if not domains:
         return PremiumResult(0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
 
@@ -220,36 +290,45 @@ def check_premium_response(response: str) -> PremiumResult:
     n = len(results)
 
     return PremiumResult(
-        length_score=round(sum(r.length_score for r in results) / n, 3),
-        word_score=round(sum(r.word_score for r in results) / n, 3),
-        tld_score=round(sum(r.tld_score for r in results) / n, 3),
-        pattern_score=round(sum(r.pattern_score for r in results) / n, 3),
-        memorability_score=round(sum(r.memorability_score for r in results) / n, 3),
-        overall=round(sum(r.overall for r in results) / n, 3),
+        length_score=sum(r.length_score for r in results) / n,
+        word_score=sum(r.word_score for r in results) / n,
+        tld_score=sum(r.tld_score for r in results) / n,
+        pattern_score=sum(r.pattern_score for r in results) / n,
+        memorability_score=sum(r.memorability_score for r in results) / n,
+        overall=sum(r.overall for r in results) / n,
     )
 
 
-def evaluate_batch(samples: list[dict]) -> dict:
+def _score_sample(sample: dict) -> PremiumResult:
+    return check_premium_from_parsed(prepare(sample['response']))
+
+
+def evaluate_batch(samples: list[dict], workers: int | None = None) -> dict:
     """
     Evaluate premium score for a batch of samples.
+
+    `workers` is passed to map_samples(): None picks serial or one process
+    per CPU based on batch size, 1 forces serial.
     """
-    results = []
-    for sample in samples:
-        result = check_premium_response(sample['response'])
-        results.append(result)
+    results = map_samples(_score_sample, samples, workers)
 
     n = len(results)
     if n == 0:
         return {"error": "No samples to evaluate"}
 
+    fields = (
+        "length_score",
+        "word_score",
+        "tld_score",
+        "pattern_score",
+        "memorability_score",
+        "overall",
+    )
+    means = mean_scores(results, fields)
+
     return {
         "num_samples": n,
-        "avg_length_score": round(sum(r.length_score for r in results) / n, 3),
-        "avg_word_score": round(sum(r.word_score for r in results) / n, 3),
-        "avg_tld_score": round(sum(r.tld_score for r in results) / n, 3),
-        "avg_pattern_score": round(sum(r.pattern_score for r in results) / n, 3),
-        "avg_memorability_score": round(sum(r.memorability_score for r in results) / n, 3),
-        "avg_overall": round(sum(r.overall for r in results) / n, 3),
+        **{f"avg_{field}": mean for field, mean in zip(fields, means)},
     }
 
 
@@ -266,4 +345,4 @@ if __name__ == "__main__":
     print("Premium/Brandability Test:")
     for name, tld in test_domains:
         result = check_premium(name, tld)
-        print(f"  {name}.{tld}: {result.overall} (length: {result.length_score}, word: {result.word_score})")
+        print(f"  {name}.{tld}: {result.overall:.3f} (length: {result.length_score:.3f}, word: {result.word_score:.3f})")
@@ -11,34 +11,80 @@ Measures how easy a domain name is to pronounce:
 
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 
+from ._aggregate import mean_scores
+from ._cache import prepare
+from ._parallel import map_samples
 
-VOWELS = set('aeiouy')
-CONSONANTS = set('bcdfghjklmnpqrstvwxz')
+VOWELS = frozenset('aeiouy')
+CONSONANTS = frozenset('bcdfghjklmnpqrstvwxz')
+
+# Byte -> 1 for vowels, 0 otherwise; translate + count(1) counts vowels in C.
+# Bytes >= 0x80 map to 0, so UTF-8 encoded non-ASCII letters count as
+# non-vowels, same as the VOWELS set.
+VOWEL_LUT = bytes(1 if chr(i) in VOWELS else 0 for i in range(256))
+
+# Patterns are compiled once at import; they run for every name scored
 
 # Common pronounceable patterns
-GOOD_PATTERNS = [
+GOOD_PATTERNS = [re.compile(p) for p in (
     r'[aeiou]',           # Has vowels
     r'[bcdfghjklmnprstvwz][aeiou]',  # CV pattern
     r'[aeiou][bcdfghjklmnprstvwz]',  # VC pattern
     r'ing$', r'ify$', r'ly$', r'io$', r'ia$',  # Common endings
     r'^[bcdfghjklmnprstvw]',  # Starts with common consonant
-]
+)]
 
 # Bad patterns - hard to pronounce
-BAD_PATTERNS = [
+BAD_PATTERNS = [re.compile(p) for p in (
     r'[bcdfghjkmnpqstvwxz]{4,}',  # 4+ consonants in a row
     r'[aeiou]{3,}',               # 3+ vowels in a row
     r'[qxz]{2,}',                 # Multiple rare consonants
     r'^[xz]',                     # Starts with x or z
     r'[0-9]{3,}',                 # 3+ numbers in a row
     r'[bcdfghjklmnpqrstvwxz]$',   # Ends with consonant cluster
-]
-
-
-@dataclass
+)]
+
+# calculate_consonant_cluster_score counts the same matches as summing
+# findall over BAD_PATTERNS, in fewer passes. The run patterns use disjoint
+# character classes, so one alternation finds exactly the matches each
+# finds alone. [qxz]{2,} overlaps the consonant run and stays separate
+# (folding it in would swallow matches), and the anchored patterns are
+# plain string checks.
+BAD_RUNS_RE = re.compile(r'[bcdfghjkmnpqstvwxz]{4,}|[aeiou]{3,}|[0-9]{3,}')
+RARE_RUN_RE = re.compile(r'[qxz]{2,}')
+BAD_START = ('x', 'z')
+BAD_END = frozenset('bcdfghjklmnpqrstvwxz')
+
+# Likewise calculate_pattern_score counts GOOD_PATTERNS hits with two regex
+# searches plus string checks. The five endings are mutually exclusive
+# (no name ends with two of them), so endswith() on the tuple is 0 or 1.
+GOOD_VOWELS = frozenset('aeiou')
+CV_RE = re.compile(r'[bcdfghjklmnprstvwz][aeiou]')
+VC_RE = re.compile(r'[aeiou][bcdfghjklmnprstvwz]')
+GOOD_ENDINGS = ('ing', 'ify', 'ly', 'io', 'ia')
+GOOD_START = frozenset('bcdfghjklmnprstvw')
+
+NON_ALPHA_RE = re.compile(r'[^a-z]')
+
+# calculate_length_score for lengths 0-15; anything longer scores 0.3
+LENGTH_SCORES = tuple(
+    1.0 if 5 <= length <= 10 else
+    0.8 if 4 <= length <= 12 else
+    0.6 if 3 <= length <= 15 else
+    0.3
+    for length in range(16)
+)
+
+
+@dataclass(frozen=True)
 class PronounceabilityResult:
-    """Result of pronounceability analysis."""
+    """Result of pronounceability analysis.
+
+    Frozen because results are cached and shared between callers.
+    Scores are kept unrounded; to_dict() rounds them to 3 places.
+    """
     vowel_ratio: float           # 0.0 - 1.0 (ideal: ~0.35-0.45)
     consonant_cluster_score: float  # 0.0 - 1.0 (1.0 = no bad clusters)
     pattern_score: float         # 0.0 - 1.0 (matches good patterns)
@@ -47,18 +93,17 @@ class PronounceabilityResult:
 
     def to_dict(self) -> dict:
         return {
-            "vowel_ratio": self.vowel_ratio,
-            "consonant_cluster_score": self.consonant_cluster_score,
-            "pattern_score": self.pattern_score,
-            "length_score": self.length_score,
-            "overall": self.overall,
+            "vowel_ratio": round(self.vowel_ratio, 3),
+            "consonant_cluster_score": round(self.consonant_cluster_score, 3),
+            "pattern_score": round(self.pattern_score, 3),
+            "length_score": round(self.length_score, 3),
+            "overall": round(self.overall, 3),
         }
 
 
 def parse_domain_names(response: str) -> list[str]:
     """Extract domain names from response."""
-    pattern = r'([a-z0-9-]+)\.[a-z]{2,10}\s*[—\-–]'
-    return [match.group(1) for match in re.finditer(pattern, response.lower())]
+    return list(prepare(response).names)
 
 
 def calculate_vowel_ratio(name: str) -> float:
@@ -66,11 +111,14 @@ def calculate_vowel_ratio(name: str) -> float:
     Calculate vowel ratio and score it.
     Ideal ratio is around 0.35-0.45 for English-like words.
     """
-    letters = [c for c in name.lower() if c.isalpha()]
-    if not letters:
-        return 0.0
-
-    vowel_count = sum(1 for c in letters if c in VOWELS)
+    letters = name.lower()
+    # check_pronounceability already passes letters only
+    if not letters.isalpha():
+        letters = ''.join(c for c in letters if c.isalpha())
+        if not letters:
+            return 0.0
+
+    vowel_count = letters.encode().translate(VOWEL_LUT).count(1)
     ratio = vowel_count / len(letters)
 
     # Score based on how close to ideal range (0.35-0.45)
@@ -92,10 +140,12 @@ def calculate_consonant_cluster_score(name: str) -> float:
     name = name.lower()
 
     # Count matches to bad patterns
-    bad_count = 0
-    for pattern in BAD_PATTERNS:
-        matches = re.findall(pattern, name)
-        bad_count += len(matches)
+    bad_count = (
+        len(BAD_RUNS_RE.findall(name))
+        + len(RARE_RUN_RE.findall(name))
+        + name.startswith(BAD_START)
+        + (name[-1:] in BAD_END)
+    )
 
     # Score inversely based on bad patterns found
     if bad_count == 0:
@@ -114,10 +164,13 @@ def calculate_pattern_score(name: str) -> float:
     """
     name = name.lower()
 
-    good_count = 0
-    for pattern in GOOD_PATTERNS:
-        if re.search(pattern, name):
-            good_count += 1
+    good_count = (
+        (not GOOD_VOWELS.isdisjoint(name))
+        + (CV_RE.search(name) is not None)
+        + (VC_RE.search(name) is not None)
+        + name.endswith(GOOD_ENDINGS)
+        + (name[:1] in GOOD_START)
+    )
 
     # Normalize by number of patterns
     return min(good_count / 4, 1.0)  # 4 matches = perfect score
@@ -126,29 +179,29 @@ def calculate_pattern_score(name: str) -> float:
 def calculate_length_score(name: str) -> float:
     """
     Score based on length.
-    Ideal: 5-10 chars
+    Ideal: 5-10 chars (1.0), then 4-12 (0.8), 3-15 (0.6), else 0.3
     """
+    # An index plus bounds check; min(len, cap) measured slower than the
+    # original if/elif chain because of the extra call
     length = len(name)
-
-    if 5 <= length <= 10:
-        return 1.0
-    elif 4 <= length <= 12:
-        return 0.8
-    elif 3 <= length <= 15:
-        return 0.6
-    else:
-        return 0.3
+    return LENGTH_SCORES[length] if length < 16 else 0.3
 
 
-def check_pronounceability(name: str) -> PronounceabilityResult:
+# Generated names repeat heavily across samples (and DPO candidates for the
+# same prompt), and scoring is a pure function of the name
+@lru_cache(maxsize=65536)
+def _score_name(name: str) -> tuple[float, float, float, float, float]:
     """
-    Analyze pronounceability of a single domain name.
+    Scores for one name, in PronounceabilityResult field order.
+
+    Plain tuples rather than result objects, so averaging a response is a
+    column-wise sum over zip(*rows) with no per-name attribute lookups.
     """
     # Remove numbers and hyphens for analysis
-    alpha_name = re.sub(r'[^a-z]', '', name.lower())
+    alpha_name = NON_ALPHA_RE.sub('', name.lower())
 
     if not alpha_name:
-        return PronounceabilityResult(0.0, 0.0, 0.0, 0.0, 0.0)
+        return (0.0, 0.0, 0.0, 0.0, 0.0)
 
     vowel_ratio = calculate_vowel_ratio(alpha_name)
     cluster_score = calculate_consonant_cluster_score(alpha_name)
@@ -163,15 +216,18 @@ def check_pronounceability(name: str) -> PronounceabilityResult:
         length_score * 0.15
     )
 
-    return PronounceabilityResult(
-        vowel_ratio=round(vowel_ratio, 3),
-        consonant_cluster_score=round(cluster_score, 3),
-        pattern_score=round(pattern_score, 3),
-        length_score=round(length_score, 3),
-        overall=round(overall, 3),
-    )
+    return vowel_ratio, cluster_score, pattern_score, length_score, overall
+
+
+def check_pronounceability(name: str) -> PronounceabilityResult:
+    """
+    Analyze pronounceability of a single domain name.
+    """
+    return PronounceabilityResult(*_score_name(name))
 
 
+# Sized like the prepare() cache, to hold a full test/val split
+@lru_cache(maxsize=16384)
 def check_pronounceability_response(response: str) -> PronounceabilityResult:
     """
     Analyze pronounceability of all domain names in a response.
@@ -181,38 +237,44 @@ def check_pronounceability_response(response: str) -> PronounceabilityResult:
     if not names:
         return PronounceabilityResult(0.0, 0.0, 0.0, 0.0, 0.0)
 
-    results = [check_pronounceability(name) for name in names]
-    n = len(results)
+    # A response has a handful of names: plain sums beat building an array
+    rows = [_score_name(name) for name in names]
+    n = len(rows)
 
-    return PronounceabilityResult(
-        vowel_ratio=round(sum(r.vowel_ratio for r in results) / n, 3),
-        consonant_cluster_score=round(sum(r.consonant_cluster_score for r in results) / n, 3),
-        pattern_score=round(sum(r.pattern_score for r in results) / n, 3),
-        length_score=round(sum(r.length_score for r in results) / n, 3),
-        overall=round(sum(r.overall for r in results) / n, 3),
-    )
+    return PronounceabilityResult(*[sum(column) / n for column in zip(*rows)])
+
+
+def _score_sample(sample: dict) -> PronounceabilityResult:
+    # Per response, not one regex pass over the joined batch: see
+    # eval._parse.parse_domains for why that measured slower
+    return check_pronounceability_response(sample['response'])
 
 
-def evaluate_batch(samples: list[dict]) -> dict:
+def evaluate_batch(samples: list[dict], workers: int | None = None) -> dict:
     """
     Evaluate pronounceability for a batch of samples.
+
+    `workers` is passed to map_samples(): None picks serial or one process
+    per CPU based on batch size, 1 forces serial.
     """
-    results = []
-    for sample in samples:
-        result = check_pronounceability_response(sample['response'])
-        results.append(result)
+    results = map_samples(_score_sample, samples, workers)
 
     n = len(results)
     if n == 0:
         return {"error": "No samples to evaluate"}
 
+    fields = (
+        "vowel_ratio",
+        "consonant_cluster_score",
+        "pattern_score",
+        "length_score",
+        "overall",
+    )
+    means = mean_scores(results, fields)
+
     return {
         "num_samples": n,
-        "avg_vowel_ratio": round(sum(r.vowel_ratio for r in results) / n, 3),
-        "avg_consonant_cluster_score": round(sum(r.consonant_cluster_score for r in results) / n, 3),
-        "avg_pattern_score": round(sum(r.pattern_score for r in results) / n, 3),
-        "avg_length_score": round(sum(r.length_score for r in results) / n, 3),
-        "avg_overall": round(sum(r.overall for r in results) / n, 3),
+        **{f"avg_{field}": mean for field, mean in zip(fields, means)},
     }
 
 
@@ -229,4 +291,4 @@ if __name__ == "__main__":
     print("Pronounceability Test:")
     for name in test_names:
         result = check_pronounceability(name)
-        print(f"  {name}: {result.overall} (vowel: {result.vowel_ratio}, cluster: {result.consonant_cluster_score})")
+        print(f"  {name}: {result.overall:.3f} (vowel: {result.vowel_ratio:.3f}, cluster: {result.consonant_cluster_score:.3f})")
@@ -6,10 +6,26 @@ Compares SFT adapter vs DPO adapter using sample prompts.
 
 import argparse
 import json
+import re
+from itertools import islice
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from peft import PeftModel
 
+from attention import pick_attn_implementation
+
+# Domains with a common TLD, for the quick response-quality scores
+DOMAIN_RE = re.compile(r'[\w-]+\.(?:com|io|dev|ai|app|tech|xyz|co|net|org)')
+
+
+def load_tokenizer(base_model: str):
+    """Load the base model's tokenizer, set up for batched generation."""
+    tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
+    tokenizer.pad_token = tokenizer.eos_token
+    # Left padding so batched prompts all end where generation starts
+    tokenizer.padding_side = "left"
+    return tokenizer
+
 
 def load_model_with_adapter(base_model: str, adapter_path: str):
     """Load base model with LoRA adapter."""
@@ -22,65 +38,82 @@ def load_model_with_adapter(base_model: str, adapter_path: str):
         bnb_4bit_use_double_quant=True,
     )
 
-    tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
-    tokenizer.pad_token = tokenizer.eos_token
-
     model = AutoModelForCausalLM.from_pretrained(
         base_model,
         quantization_config=bnb_config,
         device_map="auto",
         trust_remote_code=True,
+        torch_dtype=torch.bfloat16,  # FlashAttention-2 needs fp16/bf16
+        attn_implementation=pick_attn_implementation(),
     )
 
     print(f"Loading adapter from: {adapter_path}")
     model = PeftModel.from_pretrained(model, adapter_path)
+    model.eval()
+
+    return model
+
+
+def tokenize_prompts(tokenizer, prompts: list[str], batch_size: int = 8) -> list:
+    """
+    Apply the chat template and tokenize prompts once, in generation batches.
 
-    return model, tokenizer
+    The batches stay on the CPU; the SFT and DPO runs share the same base
+    tokenizer and prompts, so both reuse them.
+    """
+    batches = []
+    for start in range(0, len(prompts), batch_size):
+        texts = [
+            tokenizer.apply_chat_template(
+                [{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True
+            )
+            for prompt in prompts[start:start + batch_size]
+        ]
+        batches.append(tokenizer(texts, return_tensors="pt", padding=True))
+    return batches
 
 
-def generate_response(model, tokenizer, prompt: str, max_tokens: int = 256) -> str:
-    """Generate a response for a single prompt."""
-    messages = [{"role": "user", "content": prompt}]
-    text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    inputs = tokenizer([text], return_tensors="pt").to(model.device)
+def generate_responses(model, tokenizer, batch, max_tokens: int = 256) -> list[str]:
+    """Generate responses for one tokenized batch in one generate() call."""
+    # New dict: BatchEncoding.to() moves in place, which would pull the
+    # shared CPU batches onto the device
+    inputs = {key: tensor.to(model.device) for key, tensor in batch.items()}
 
-    with torch.no_grad():
+    with torch.inference_mode():
         outputs = model.generate(
             **inputs,
             max_new_tokens=max_tokens,
             temperature=0.7,
             top_p=0.9,
             do_sample=True,
+            use_cache=True,
             pad_token_id=tokenizer.pad_token_id,
         )
 
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    # Keep only the generated tokens; the (left-padded) prompt comes first
+    new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+    return [response.strip() for response in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
 
-    # Extract assistant response
-    if "<|im_start|>assistant" in response:
-        response = response.split("<|im_start|>assistant")[-1].strip()
-        if "<|im_end|>" in response:
-            response = response.split("<|im_end|>")[0].strip()
-    else:
-        response = response[len(text):].strip()
 
-    return response
+def evaluate_adapter(
+    base_model: str,
+    adapter_path: str,
+    tokenizer,
+    prompts: list,
+    batches: list,
+):
+    """Evaluate an adapter on test prompts, pre-tokenized by tokenize_prompts()."""
+    model = load_model_with_adapter(base_model, adapter_path)
 
+    responses = []
+    for batch in batches:
+        responses.extend(generate_responses(model, tokenizer, batch))
+        print(f"  Generated {len(responses)}/{len(prompts)}")
 
-def evaluate_adapter(base_model: str, adapter_path: str, test_prompts: list, num_samples: int = 20):
-    """Evaluate an adapter on test prompts."""
-    model, tokenizer = load_model_with_adapter(base_model, adapter_path)
-
-    results = []
-    for i, prompt in enumerate(test_prompts[:num_samples]):
-        if (i + 1) % 5 == 0:
-            print(f"  Generated {i + 1}/{num_samples}")
-
-        response = generate_response(model, tokenizer, prompt)
-        results.append({
-            "prompt": prompt,
-            "response": response,
-        })
+    results = [
+        {"prompt": prompt, "response": response}
+        for prompt, response in zip(prompts, responses)
+    ]
 
     # Free memory
     del model
@@ -106,8 +139,7 @@ def score_responses(responses: list) -> dict:
         scores["avg_length"] += len(response)
 
         # Count domains (look for .com, .io, etc patterns)
-        import re
-        domains = re.findall(r'[\w-]+\.(?:com|io|dev|ai|app|tech|xyz|co|net|org)', response.lower())
+        domains = DOMAIN_RE.findall(response.lower())
         if domains:
             scores["has_domains"] += 1
             scores["avg_domain_count"] += len(domains)
@@ -130,27 +162,30 @@ def main():
     parser.add_argument("--dpo_adapter", default="output-dpo")
     parser.add_argument("--test_file", default="data/test.jsonl")
     parser.add_argument("--num_samples", type=int, default=20)
+    parser.add_argument("--batch_size", type=int, default=8, help="Prompts per generate() call")
     args = parser.parse_args()
 
     # Load test prompts
     print(f"Loading test prompts from {args.test_file}...")
-    prompts = []
+    # Only the first num_samples prompts are evaluated, so stop reading there
     with open(args.test_file, "r") as f:
-        for line in f:
-            data = json.loads(line)
-            prompts.append(data["prompt"])
+        prompts = [json.loads(line)["prompt"] for line in islice(f, args.num_samples)]
     print(f"  Loaded {len(prompts)} prompts")
 
+    # Template and tokenize once; both adapters share the base tokenizer
+    tokenizer = load_tokenizer(args.base_model)
+    batches = tokenize_prompts(tokenizer, prompts, args.batch_size)
+
     print(f"\n{'='*60}")
     print("Evaluating SFT Model")
     print('='*60)
-    sft_results = evaluate_adapter(args.base_model, args.sft_adapter, prompts, args.num_samples)
+    sft_results = evaluate_adapter(args.base_model, args.sft_adapter, tokenizer, prompts, batches)
     sft_scores = score_responses(sft_results)
 
     print(f"\n{'='*60}")
     print("Evaluating DPO Model")
     print('='*60)
-    dpo_results = evaluate_adapter(args.base_model, args.dpo_adapter, prompts, args.num_samples)
+    dpo_results = evaluate_adapter(args.base_model, args.dpo_adapter, tokenizer, prompts, batches)
     dpo_scores = score_responses(dpo_results)
 
     print(f"\n{'='*60}")
@@ -11,9 +11,8 @@ from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
     BitsAndBytesConfig,
-    TrainingArguments,
 )
-from trl import SFTTrainer
+from trl import SFTTrainer, SFTConfig
 
 
 @dataclass
@@ -55,18 +54,28 @@ def parse_args() -> TrainConfig:
     )
 
 
-def build_text(example, tokenizer):
-    prompt = (example.get("prompt") or "").strip()
-    response = (example.get("response") or "").strip()
-    messages = [
-        {"role": "user", "content": prompt},
-        {"role": "assistant", "content": response},
+def build_text_batch(batch, tokenizer):
+    """
+    Render a batch of prompt/response pairs with one apply_chat_template call.
+    A missing prompt or response column renders as empty strings.
+    """
+    num_rows = len(next(iter(batch.values())))
+    prompts = batch.get("prompt", [None] * num_rows)
+    responses = batch.get("response", [None] * num_rows)
+    conversations = [
+        [
+            {"role": "user", "content": (prompt or "").strip()},
+            {"role": "assistant", "content": (response or "").strip()},
+        ]
+        for prompt, response in zip(prompts, responses)
     ]
-    return tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=False,
-    )
+    return {
+        "text": tokenizer.apply_chat_template(
+            conversations,
+            tokenize=False,
+            add_generation_prompt=False,
+        )
+    }
 
 
 def main():
@@ -106,6 +115,11 @@ def main():
         device_map="auto",
         torch_dtype=torch.bfloat16,
     )
+    # The KV cache is useless in training and conflicts with checkpointing
+    model.config.use_cache = False
+
+    # TF32 for any matmuls that still run in fp32 (Ampere+)
+    torch.backends.cuda.matmul.allow_tf32 = True
 
     print("Loading dataset...")
     dataset = load_dataset("json", data_files=cfg.data, split="train")
@@ -117,7 +131,10 @@ def main():
     
     print(f"Processing {len(dataset)} examples...")
     dataset = dataset.map(
-        lambda ex: {"text": build_text(ex, tokenizer)},
+        build_text_batch,
+        batched=True,
+        batch_size=1000,
+        fn_kwargs={"tokenizer": tokenizer},
         remove_columns=dataset.column_names,
         num_proc=min(8, os.cpu_count() or 1),
     )
@@ -140,7 +157,7 @@ def main():
         ],
     )
 
-    training_args = TrainingArguments(
+    training_args = SFTConfig(
         output_dir=cfg.output,
         per_device_train_batch_size=cfg.batch_size,
         gradient_accumulation_steps=cfg.grad_accum,
@@ -153,16 +170,21 @@ def main():
         optim="paged_adamw_8bit",
         lr_scheduler_type="cosine",
         warmup_ratio=0.03,
+        gradient_checkpointing=True,  # Memory optimization
+        gradient_checkpointing_kwargs={"use_reentrant": False},
         report_to="none",
+        # SFT-specific params (moved from SFTTrainer)
+        max_length=cfg.max_seq_len,
+        dataset_text_field="text",
+        # Concatenate examples into max_length rows, as the old packing did
+        packing=True,
+        packing_strategy="wrapped",
     )
 
     trainer = SFTTrainer(
         model=model,
-        tokenizer=tokenizer,
+        processing_class=tokenizer,
         train_dataset=dataset,
-        dataset_text_field="text",
-        max_seq_length=cfg.max_seq_len,
-        packing=True,
         peft_config=lora_config,
         args=training_args,
     )
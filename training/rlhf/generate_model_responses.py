@@ -9,19 +9,48 @@ Usage (on RunPod):
         --test_file /workspace/training/data/test.jsonl \
         --output /workspace/training/rlhf/model_responses.jsonl \
         --num_prompts 500
+
+    # Same job on vLLM: every prompt x temperature in one batched generate
+    python generate_model_responses.py ... --backend vllm
+
+    # Or serve a merged checkpoint (merge_adapter.py), quantized to FP8 on load
+    python generate_model_responses.py ... --backend vllm \
+        --merged_model /workspace/training/output-merged --quantization fp8
 """
 
 import argparse
 import json
+import os
+import sys
+from itertools import islice
 from pathlib import Path
 import torch
 from tqdm import tqdm
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 from peft import PeftModel
 
+# Add training/ to path for the shared attention helper
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from attention import pick_attn_implementation
+
+# fsync the output after this many response sets
+FSYNC_EVERY = 25
+
+# --compile pads prompt lengths up to a multiple of this, so batches fall
+# into a few static-cache shapes instead of one per batch
+COMPILE_PAD_MULTIPLE = 64
 
-def load_model(model_path: str, base_model: str = "Qwen/Qwen2.5-7B-Instruct"):
-    """Load fine-tuned model with LoRA adapter"""
+
+def load_model(model_path: str, base_model: str = "Qwen/Qwen2.5-7B-Instruct", compile_model: bool = False):
+    """
+    Load fine-tuned model with LoRA adapter
+
+    compile_model runs the forward pass that generate() uses (the base
+    model's, with the LoRA layers injected) through torch.compile with a
+    static KV cache. Compiling takes minutes, so it only pays off over long
+    runs.
+    """
     print(f"Loading base model: {base_model}")
 
     bnb_config = BitsAndBytesConfig(
@@ -33,64 +62,219 @@ def load_model(model_path: str, base_model: str = "Qwen/Qwen2.5-7B-Instruct"):
 
     tokenizer = AutoTokenizer.from_pretrained(base_model, trust_remote_code=True)
     tokenizer.pad_token = tokenizer.eos_token
+    # Left padding so batched prompts all end where generation starts
+    tokenizer.padding_side = "left"
 
     model = AutoModelForCausalLM.from_pretrained(
         base_model,
         quantization_config=bnb_config,
         device_map="auto",
         trust_remote_code=True,
+        attn_implementation=pick_attn_implementation(static_cache=compile_model),
     )
 
     print(f"Loading LoRA adapter from: {model_path}")
     model = PeftModel.from_pretrained(model, model_path)
     model.set_adapter("default")
+    model.eval()
+
+    if compile_model:
+        # PeftModel.generate hands off to the wrapped model's generate, which
+        # calls that model's forward: compile that one, not the wrapper's.
+        # A static KV cache keeps decode-step shapes fixed (max_new_tokens is
+        # constant), so the compiled forward is reused for every token
+        base = model.get_base_model()
+        base.generation_config.cache_implementation = "static"
+        base.forward = torch.compile(base.forward, mode="reduce-overhead", fullgraph=False)
+
     return model, tokenizer
 
 
-def generate_responses(model, tokenizer, prompt: str, num_responses: int = 4):
-    """Generate multiple diverse responses for a prompt"""
+def load_vllm(
+    model_path: str,
+    base_model: str = "Qwen/Qwen2.5-7B-Instruct",
+    merged_model: str = None,
+    quantization: str = None,
+):
+    """
+    Load a vLLM engine and the LoRA request to generate with.
+
+    With merged_model (see merge_adapter.py) the adapter is already in the
+    weights, so the engine runs without LoRA and the request is None.
+    Otherwise the base model is loaded with LoRA enabled for model_path.
+    quantization is passed through to vLLM ("fp8" quantizes on load; AWQ
+    needs an AWQ checkpoint).
+    """
+    from vllm import LLM
+    from vllm.lora.request import LoRARequest
+
+    engine_kwargs = {}
+    if merged_model:
+        print(f"Loading merged model into vLLM: {merged_model}")
+        model = merged_model
+        lora_request = None
+    else:
+        print(f"Loading base model into vLLM: {base_model}")
+        model = base_model
+        # vLLM sizes its LoRA buffers up front, so it needs the adapter's rank
+        with open(Path(model_path) / "adapter_config.json", "r") as f:
+            engine_kwargs["max_lora_rank"] = json.load(f)["r"]
+        engine_kwargs["enable_lora"] = True
+        lora_request = LoRARequest("default", 1, model_path)
+
+    llm = LLM(
+        model=model,
+        quantization=quantization,
+        dtype="auto" if quantization else "bfloat16",
+        gpu_memory_utilization=0.9,
+        # The temperature variants of a prompt are separate requests with
+        # an identical prompt; prefix caching lets them share its KV blocks
+        # so the prompt is prefilled once, not once per temperature
+        enable_prefix_caching=True,
+        trust_remote_code=True,
+        **engine_kwargs,
+    )
+    return llm, llm.get_tokenizer(), lora_request
+
+
+def generate_all_vllm(llm, tokenizer, prompts: list[str], num_responses: int = 4, lora_request=None):
+    """
+    Generate num_responses responses for every prompt in one llm.generate call.
+
+    Each (prompt, temperature) pair becomes its own request, so vLLM
+    schedules the whole sweep as a single continuously batched job instead
+    of len(prompts) * num_responses sequential generate calls. A prompt's
+    requests are submitted back to back so they hit the prefix cache.
+    """
+    from vllm import SamplingParams
+
     temperatures = [0.7, 0.9, 1.0, 1.1][:num_responses]
-    responses = []
-
-    messages = [{"role": "user", "content": prompt}]
-    text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    inputs = tokenizer(text, return_tensors="pt").to(model.device)
-
-    for temp in temperatures:
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=256,
-                temperature=temp,
-                top_p=0.95,
-                do_sample=True,
-                pad_token_id=tokenizer.pad_token_id,
+    params_by_temp = [
+        SamplingParams(n=1, temperature=temp, top_p=0.95, max_tokens=256)
+        for temp in temperatures
+    ]
+
+    texts = []
+    params = []
+    for prompt in prompts:
+        messages = [{"role": "user", "content": prompt}]
+        text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        texts.extend([text] * len(temperatures))
+        params.extend(params_by_temp)
+
+    outputs = llm.generate(texts, params, lora_request=lora_request)
+
+    # Outputs come back in request order: regroup them per prompt
+    k = len(temperatures)
+    return [
+        [output.outputs[0].text.strip() for output in outputs[i:i + k]]
+        for i in range(0, len(outputs), k)
+    ]
+
+
+def generate_responses(
+    model,
+    tokenizer,
+    prompts: list[str],
+    num_responses: int = 4,
+    batch_size: int = 16,
+    fixed_shapes: bool = False,
+):
+    """
+    Generate multiple diverse responses for each prompt.
+
+    Prompts go through model.generate batch_size at a time, once per
+    temperature. Yields one list of responses per prompt, in order, as
+    each batch finishes.
+
+    fixed_shapes (for a compiled model with a static KV cache) pads each
+    batch to a multiple of COMPILE_PAD_MULTIPLE tokens and to a full
+    batch_size rows, so batches share a few cache shapes instead of
+    recompiling for every batch.
+    """
+    temperatures = [0.7, 0.9, 1.0, 1.1][:num_responses]
+
+    for start in range(0, len(prompts), batch_size):
+        texts = [
+            tokenizer.apply_chat_template(
+                [{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True
             )
-        full_output = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        response = full_output[len(text):].strip()
-        responses.append(response)
+            for prompt in prompts[start:start + batch_size]
+        ]
+        num_real = len(texts)
+        if fixed_shapes:
+            # Fill a short last batch with copies; their outputs are dropped
+            texts += texts[-1:] * (batch_size - num_real)
+        inputs = tokenizer(
+            texts,
+            return_tensors="pt",
+            padding=True,
+            pad_to_multiple_of=COMPILE_PAD_MULTIPLE if fixed_shapes else None,
+        ).to(model.device)
+        prompt_len = inputs["input_ids"].shape[1]
+
+        batch_responses = [[] for _ in range(num_real)]
+        for temp in temperatures:
+            with torch.inference_mode():
+                outputs = model.generate(
+                    **inputs,
+                    max_new_tokens=256,
+                    temperature=temp,
+                    top_p=0.95,
+                    do_sample=True,
+                    pad_token_id=tokenizer.pad_token_id,
+                    use_cache=True,
+                )
+            # Keep only the generated tokens; the (left-padded) prompt comes first
+            decoded = tokenizer.batch_decode(outputs[:, prompt_len:], skip_special_tokens=True)
+            for responses, response in zip(batch_responses, decoded):
+                responses.append(response.strip())
 
-    return responses
+        yield from batch_responses
+
+
+def iter_test_prompts(lines):
+    """Yield the user prompt of each JSONL line (supports both formats)"""
+    for line in lines:
+        data = json.loads(line)
+        # Format 1: {"prompt": ..., "response": ...}
+        if "prompt" in data:
+            yield data["prompt"]
+        # Format 2: {"messages": [{"role": "user", "content": ...}, ...]}
+        elif "messages" in data:
+            for msg in data["messages"]:
+                if msg["role"] == "user":
+                    yield msg["content"]
+                    break
 
 
 def load_test_prompts(test_file: str, num_prompts: int):
     """Load prompts from test JSONL file (supports both formats)"""
-    prompts = []
     with open(test_file, "r") as f:
+        # islice stops reading the file as soon as enough prompts are found
+        return list(islice(iter_test_prompts(f), num_prompts))
+
+
+def load_finished_prompts(output_path: Path) -> set[str]:
+    """
+    Prompts that already have a response set in output_path.
+
+    A run killed mid-write can leave a torn last line; it is cut off so
+    appended lines start on a fresh line and the prompt is regenerated.
+    """
+    done = set()
+    valid_end = 0
+    with open(output_path, "rb+") as f:
         for line in f:
-            if len(prompts) >= num_prompts:
+            if not line.endswith(b"\n"):
                 break
-            data = json.loads(line)
-            # Format 1: {"prompt": ..., "response": ...}
-            if "prompt" in data:
-                prompts.append(data["prompt"])
-            # Format 2: {"messages": [{"role": "user", "content": ...}, ...]}
-            elif "messages" in data:
-                for msg in data["messages"]:
-                    if msg["role"] == "user":
-                        prompts.append(msg["content"])
-                        break
-    return prompts
+            try:
+                done.add(json.loads(line)["prompt"])
+            except (json.JSONDecodeError, KeyError):
+                break
+            valid_end += len(line)
+        f.truncate(valid_end)
+    return done
 
 
 def main():
@@ -101,10 +285,20 @@ def main():
     parser.add_argument("--output", required=True)
     parser.add_argument("--num_prompts", type=int, default=500)
     parser.add_argument("--responses_per_prompt", type=int, default=4)
+    parser.add_argument("--batch_size", type=int, default=16, help="hf backend: prompts per generate() call")
+    parser.add_argument("--compile", action="store_true",
+                        help="hf backend: torch.compile the model (slow start, faster decode)")
+    parser.add_argument("--backend", default="hf", choices=["hf", "vllm"],
+                        help="hf: transformers + 4-bit base, batch_size prompts at a time; "
+                             "vllm: batched generation over all prompts (needs vllm installed)")
+    parser.add_argument("--merged_model", help="vllm backend: merged checkpoint from merge_adapter.py "
+                                               "to serve instead of base model + adapter")
+    parser.add_argument("--quantization", choices=["fp8", "awq"],
+                        help="vllm backend: weight quantization (awq needs an AWQ checkpoint)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep the response sets already in --output and only generate the missing prompts")
     args = parser.parse_args()
 
-    model, tokenizer = load_model(args.model_path, args.base_model)
-
     print(f"Loading prompts from {args.test_file}...")
     prompts = load_test_prompts(args.test_file, args.num_prompts)
     print(f"  Loaded {len(prompts)} prompts")
@@ -112,16 +306,49 @@ def main():
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    results = []
-    for prompt in tqdm(prompts, desc="Generating responses"):
-        responses = generate_responses(model, tokenizer, prompt, args.responses_per_prompt)
-        results.append({"prompt": prompt, "responses": responses})
+    if args.resume and output_path.exists():
+        done = load_finished_prompts(output_path)
+        prompts = [prompt for prompt in prompts if prompt not in done]
+        print(f"  Resuming: {len(done)} prompts already in {output_path}, {len(prompts)} to go")
+        mode = "a"
+    else:
+        mode = "w"
+
+    if not prompts:
+        print("Nothing to generate")
+        return
+
+    if args.backend == "vllm":
+        model, tokenizer, lora_request = load_vllm(
+            args.model_path, args.base_model, args.merged_model, args.quantization
+        )
+        all_responses = generate_all_vllm(
+            model, tokenizer, prompts, args.responses_per_prompt, lora_request
+        )
+    else:
+        model, tokenizer = load_model(args.model_path, args.base_model, args.compile)
+        # Lazily, so each batch is written as it finishes
+        all_responses = tqdm(
+            generate_responses(
+                model, tokenizer, prompts, args.responses_per_prompt, args.batch_size, fixed_shapes=args.compile
+            ),
+            total=len(prompts),
+            desc="Generating responses",
+        )
 
-    with open(output_path, "w") as f:
-        for item in results:
+    # Line-buffered: every finished response set reaches the OS right away;
+    # an fsync every FSYNC_EVERY sets makes it survive a machine crash too
+    num_written = 0
+    with open(output_path, mode, buffering=1) as f:
+        for prompt, responses in zip(prompts, all_responses):
+            item = {"prompt": prompt, "responses": responses}
             f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            num_written += 1
+            if num_written % FSYNC_EVERY == 0:
+                os.fsync(f.fileno())
+        os.fsync(f.fileno())
 
-    print(f"Generated {len(results)} response sets -> {output_path}")
+    print(f"Generated {num_written} response sets -> {output_path}")
 
 
 if __name__ == "__main__":
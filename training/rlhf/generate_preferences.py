@@ -20,10 +20,17 @@ Usage:
 
 import argparse
 import asyncio
+import hashlib
+import heapq
 import json
 import os
 import random
+import re
+import shelve
+from collections.abc import MutableMapping
 from dataclasses import dataclass, asdict
+from itertools import islice
+from operator import attrgetter
 from pathlib import Path
 from typing import Optional
 import httpx
@@ -43,13 +50,13 @@ JUDGES = {
     }
 }
 
-JUDGE_PROMPT_TEMPLATE = """You are an expert domain name evaluator. Score this domain name suggestion on a scale of 1-10.
+JUDGE_PROMPT_TEMPLATE = """You are an expert domain name evaluator. Score each domain name suggestion below on a scale of 1-10.
 
 **Original Request:**
 {prompt}
 
-**Domain Suggestion:**
-{domain}
+**Domain Suggestions:**
+{domains}
 
 **Evaluation Criteria (focus on {focus}):**
 1. Brandability (1-10): Is it memorable and marketable?
@@ -58,20 +65,48 @@ JUDGE_PROMPT_TEMPLATE = """You are an expert domain name evaluator. Score this d
 4. Creativity (1-10): Is it unique and clever?
 5. Overall (1-10): Would you recommend this domain?
 
-Respond with ONLY a JSON object:
-{{"brandability": X, "pronounceability": X, "constraint": X, "creativity": X, "overall": X}}
+Respond with ONLY a JSON array with one object per suggestion, in the same order:
+[{{"idx": 0, "brandability": X, "pronounceability": X, "constraint": X, "creativity": X, "overall": X}}, ...]
 """
 
+# A domain at the start of a line, after optional numbering ("1." / "2)"),
+# bullet ("-", "*", "•") and markdown emphasis ("**", "`"). Anything after
+# it on the line ("— reason", "(bright + ly)") is ignored.
+DOMAIN_LINE_RE = re.compile(
+    r"^[ \t]*(?:\d{1,2}[.)][ \t]*|[-*•][ \t]*)?[*`]*"
+    r"([a-z0-9](?:[a-z0-9-]*[a-z0-9])?(?:\.[a-z]{2,63})+)\b",
+    re.IGNORECASE | re.MULTILINE,
+)
 
-@dataclass
+# Longest domain worth sending to the judges
+MAX_DOMAIN_LENGTH = 40
+
+# Output tokens budgeted per domain in a batched judge call
+MAX_TOKENS_PER_DOMAIN = 60
+
+# Reported for a domain no judge managed to score; such domains are never paired
+NEUTRAL_SCORES = {"brandability": 5, "pronounceability": 5, "constraint": 5, "creativity": 5, "overall": 5}
+
+# Rate-limit and server errors are retried this many times, with exponential
+# backoff from JUDGE_RETRY_DELAY seconds (or the server's Retry-After)
+JUDGE_MAX_RETRIES = 4
+JUDGE_RETRY_DELAY = 2.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Part of every judge cache key, so editing the template invalidates old scores
+JUDGE_PROMPT_HASH = hashlib.blake2b(JUDGE_PROMPT_TEMPLATE.encode(), digest_size=8).hexdigest()
+
+
+@dataclass(slots=True)
 class DomainCandidate:
     """A single domain name candidate with scores"""
     domain: str
     scores: dict
     combined_score: float = 0.0
+    scored: bool = True  # False if every judge failed and the scores are NEUTRAL_SCORES
 
 
-@dataclass
+@dataclass(slots=True)
 class PreferencePair:
     """A preference pair for DPO training"""
     prompt: str
@@ -81,52 +116,98 @@ class PreferencePair:
     rejected_score: float
 
 
+def clean_judge_scores(item: dict) -> Optional[dict]:
+    """
+    The judge's scores for one domain, reduced to the NEUTRAL_SCORES
+    criteria. None if any criterion is missing or not a number, so the
+    domain counts as unscored.
+    """
+    scores = {}
+    for criterion in NEUTRAL_SCORES:
+        value = item.get(criterion)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        scores[criterion] = value
+    return scores
+
+
+def retry_delay(response: Optional[httpx.Response], attempt: int) -> float:
+    """Seconds to wait before retry number attempt (0-based)"""
+    if response is not None:
+        retry_after = response.headers.get("retry-after", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+    # Jitter keeps the concurrent prompts from retrying in lockstep
+    return JUDGE_RETRY_DELAY * 2 ** attempt * random.uniform(1.0, 1.5)
+
+
+async def post_judge_request(client: httpx.AsyncClient, judge_name: str, payload: dict) -> httpx.Response:
+    """
+    POST a judge request, retrying timeouts, rate limits (429) and server
+    errors (5xx) up to JUDGE_MAX_RETRIES times with backoff. Returns the
+    last response; raises httpx.TimeoutException if every attempt timed out.
+    """
+    for attempt in range(JUDGE_MAX_RETRIES + 1):
+        try:
+            response = await client.post("https://openrouter.ai/api/v1/chat/completions", json=payload)
+        except httpx.TimeoutException:
+            if attempt == JUDGE_MAX_RETRIES:
+                raise
+            response = None
+        else:
+            if response.status_code not in RETRYABLE_STATUS or attempt == JUDGE_MAX_RETRIES:
+                return response
+
+        delay = retry_delay(response, attempt)
+        reason = "timeout" if response is None else f"HTTP {response.status_code}"
+        print(f"  [~] {judge_name} {reason}, retrying in {delay:.0f}s")
+        await asyncio.sleep(delay)
+
+
 async def call_judge(
     client: httpx.AsyncClient,
     judge_name: str,
     prompt: str,
-    domain: str,
-    api_key: str
-) -> dict:
-    """Call a judge model to score a domain suggestion"""
+    domains: list[str]
+) -> list[dict]:
+    """
+    Call a judge model to score all domain suggestions for a prompt.
+
+    One request per (prompt, judge) instead of one per domain: the request
+    text is sent once and the judge scores the whole list. Returns one
+    score dict per domain, in order, or None for a domain the judge did
+    not score with all five numeric criteria (every domain, if the call
+    failed).
+    """
     judge_config = JUDGES[judge_name]
+    unscored = [None] * len(domains)
 
     eval_prompt = JUDGE_PROMPT_TEMPLATE.format(
         prompt=prompt,
-        domain=domain,
+        domains="\n".join(f"{i}. {domain}" for i, domain in enumerate(domains)),
         focus=judge_config["focus"]
     )
 
     try:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://domain-search-mcp.com",
-                "X-Title": "Domain Name Evaluator",
-            },
-            json={
-                "model": judge_config["model"],
-                "messages": [{"role": "user", "content": eval_prompt}],
-                "temperature": 0.1,
-                "max_tokens": 200,
-            },
-            timeout=60.0  # Increased timeout for slower models
-        )
+        response = await post_judge_request(client, judge_name, {
+            "model": judge_config["model"],
+            "messages": [{"role": "user", "content": eval_prompt}],
+            "temperature": 0.1,
+            "max_tokens": MAX_TOKENS_PER_DOMAIN * len(domains),
+        })
 
         # Check for error responses
         if response.status_code != 200:
             error_text = response.text[:200] if response.text else "Empty response"
             print(f"  [!] {judge_name} HTTP {response.status_code}: {error_text}")
-            return {"brandability": 5, "pronounceability": 5, "constraint": 5, "creativity": 5, "overall": 5}
+            return unscored
 
         response_data = response.json()
 
         # Check for API-level errors
         if "error" in response_data:
             print(f"  [!] {judge_name} API error: {response_data['error']}")
-            return {"brandability": 5, "pronounceability": 5, "constraint": 5, "creativity": 5, "overall": 5}
+            return unscored
 
         content = response_data["choices"][0]["message"]["content"]
 
@@ -137,109 +218,153 @@ async def call_judge(
         elif "```" in content:
             content = content.split("```")[1].split("```")[0]
 
-        scores = json.loads(content.strip())
+        items = json.loads(content.strip())
+        if not isinstance(items, list):
+            print(f"  [!] {judge_name} expected a JSON array, got {type(items).__name__}")
+            return unscored
+
+        # Place each object by its idx; fall back to position if idx is missing
+        scores = list(unscored)
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            idx = item.get("idx", position)
+            if isinstance(idx, int) and 0 <= idx < len(domains):
+                scores[idx] = clean_judge_scores(item)
         return scores
 
     except json.JSONDecodeError as e:
         print(f"  [!] {judge_name} JSON parse error: {e}")
-        return {"brandability": 5, "pronounceability": 5, "constraint": 5, "creativity": 5, "overall": 5}
+        return unscored
     except httpx.TimeoutException:
-        print(f"  [!] {judge_name} timeout after 60s")
-        return {"brandability": 5, "pronounceability": 5, "constraint": 5, "creativity": 5, "overall": 5}
+        print(f"  [!] {judge_name} timed out {JUDGE_MAX_RETRIES + 1} times")
+        return unscored
     except Exception as e:
         print(f"  [!] {judge_name} error: {type(e).__name__}: {e}")
-        # Return neutral scores on error
-        return {"brandability": 5, "pronounceability": 5, "constraint": 5, "creativity": 5, "overall": 5}
+        return unscored
+
+
+def judge_cache_key(model: str, prompt: str, domain: str) -> str:
+    """Key for one judge score in the judge cache"""
+    return hashlib.blake2b(
+        f"{JUDGE_PROMPT_HASH}|{model}|{prompt}|{domain}".encode(), digest_size=16
+    ).hexdigest()
+
+
+async def call_judge_cached(
+    client: httpx.AsyncClient,
+    judge_name: str,
+    prompt: str,
+    domains: list[str],
+    cache: MutableMapping
+) -> list[Optional[dict]]:
+    """
+    call_judge, but only for the domains this judge has not already scored
+    for this prompt. Successful scores are stored in `cache`; domains the
+    judge failed to score stay None and are not cached, so they are retried
+    on the next run.
+    """
+    model = JUDGES[judge_name]["model"]
+    keys = [judge_cache_key(model, prompt, domain) for domain in domains]
+    scores = [cache.get(key) for key in keys]
+
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        fresh = await call_judge(client, judge_name, prompt, [domains[i] for i in missing])
+        for i, score in zip(missing, fresh):
+            if score is not None:
+                cache[keys[i]] = score
+                scores[i] = score
 
+    return scores
 
-async def score_candidate(
+
+async def score_candidates(
     client: httpx.AsyncClient,
     prompt: str,
-    domain: str,
-    api_key: str,
-    active_judges: dict = None
-) -> DomainCandidate:
-    """Score a domain candidate using hybrid judges"""
+    domains: list[str],
+    active_judges: dict = None,
+    cache: Optional[MutableMapping] = None
+) -> list[DomainCandidate]:
+    """
+    Score all domain candidates for a prompt using hybrid judges.
+
+    A domain's scores average the judges that actually scored it. If none
+    did, it gets NEUTRAL_SCORES and scored=False.
+    """
 
     if active_judges is None:
         active_judges = JUDGES
-
-    # Call judges in parallel
-    tasks = []
-    judge_names = []
-    for judge_name in active_judges.keys():
-        tasks.append(call_judge(client, judge_name, prompt, domain, api_key))
-        judge_names.append(judge_name)
-
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    # Combine scores with weights
-    combined_scores = {}
-    total_weight = 0
-
-    for judge_name, result in zip(judge_names, results):
-        if isinstance(result, Exception):
-            continue
-
-        weight = active_judges[judge_name]["weight"]
-        total_weight += weight
-
-        for key, value in result.items():
-            if key not in combined_scores:
-                combined_scores[key] = 0
-            combined_scores[key] += value * weight
-
-    if total_weight > 0:
-        for key in combined_scores:
-            combined_scores[key] /= total_weight
-
-    # Calculate final score (weighted average of all criteria)
-    final_score = (
-        combined_scores.get("brandability", 5) * 0.25 +
-        combined_scores.get("pronounceability", 5) * 0.20 +
-        combined_scores.get("constraint", 5) * 0.25 +
-        combined_scores.get("creativity", 5) * 0.15 +
-        combined_scores.get("overall", 5) * 0.15
+    if cache is None:
+        cache = {}
+
+    # Call judges in parallel, one batched request each
+    judge_names = list(active_judges.keys())
+    results = await asyncio.gather(
+        *(call_judge_cached(client, judge_name, prompt, domains, cache) for judge_name in judge_names),
+        return_exceptions=True
     )
 
-    return DomainCandidate(
-        domain=domain,
-        scores=combined_scores,
-        combined_score=final_score
-    )
+    candidates = []
+    for i, domain in enumerate(domains):
+        # Combine scores with weights
+        combined_scores = {}
+        total_weight = 0
 
+        for judge_name, result in zip(judge_names, results):
+            if isinstance(result, Exception) or result[i] is None:
+                continue
 
-def extract_domains_from_response(response: str) -> list[str]:
-    """Extract domain names from model response"""
-    domains = []
-    lines = response.strip().split("\n")
+            weight = active_judges[judge_name]["weight"]
+            total_weight += weight
+
+            for key, value in result[i].items():
+                if key not in combined_scores:
+                    combined_scores[key] = 0
+                combined_scores[key] += value * weight
+
+        if total_weight > 0:
+            for key in combined_scores:
+                combined_scores[key] /= total_weight
+        else:
+            combined_scores = dict(NEUTRAL_SCORES)
+
+        # Calculate final score (weighted average of all criteria)
+        final_score = (
+            combined_scores.get("brandability", 5) * 0.25 +
+            combined_scores.get("pronounceability", 5) * 0.20 +
+            combined_scores.get("constraint", 5) * 0.25 +
+            combined_scores.get("creativity", 5) * 0.15 +
+            combined_scores.get("overall", 5) * 0.15
+        )
 
-    for line in lines:
-        line = line.strip()
-        # Skip empty lines and headers
-        if not line or line.startswith("#") or line.startswith("Here"):
-            continue
+        candidates.append(DomainCandidate(
+            domain=domain,
+            scores=combined_scores,
+            combined_score=final_score,
+            scored=total_weight > 0
+        ))
+
+    return candidates
 
-        # Remove numbering (1. 2. - etc.)
-        if line[0].isdigit() and "." in line[:3]:
-            line = line.split(".", 1)[1].strip()
-        if line.startswith("-"):
-            line = line[1:].strip()
 
-        # Extract just the domain part (remove descriptions)
-        if " - " in line:
-            line = line.split(" - ")[0].strip()
-        if " (" in line:
-            line = line.split(" (")[0].strip()
+def extract_domains_from_response(response: str) -> list[str]:
+    """Extract domain names from model response"""
+    # First domain on each list line; duplicates dropped, order kept
+    domains = dict.fromkeys(DOMAIN_LINE_RE.findall(response))
+    return list(domains)[:10]  # Max 10 per response
 
-        # Clean up
-        domain = line.strip("*").strip("`").strip()
 
-        # Validate it looks like a domain
-        if domain and "." in domain and len(domain) < 50:
-            domains.append(domain)
+def is_judgeable(domain: str) -> bool:
+    """
+    Cheap local check that a candidate is a plausible registrable domain.
 
-    return domains[:10]  # Max 10 per response
+    Only rejects malformed candidates (non-ASCII, one-letter names, overlong
+    domains). Well-formed but weak names are kept: they are the rejected
+    side of the preference pairs.
+    """
+    name = domain.partition(".")[0]
+    return domain.isascii() and len(name) >= 2 and len(domain) <= MAX_DOMAIN_LENGTH
 
 
 async def generate_candidates_local(
@@ -258,51 +383,63 @@ async def generate_candidates_local(
     return []
 
 
+def iter_test_prompts(lines):
+    """Yield a prompt dict for each JSONL line (supports both formats)"""
+    for line in lines:
+        data = json.loads(line)
+        # Format 1: {"prompt": ..., "response": ...}
+        if "prompt" in data:
+            yield {
+                "prompt": data["prompt"],
+                "expected": data.get("response", "")
+            }
+        # Format 2: {"messages": [{"role": "user", "content": ...}, ...]}
+        elif "messages" in data:
+            for msg in data["messages"]:
+                if msg["role"] == "user":
+                    yield {
+                        "prompt": msg["content"],
+                        "expected": data["messages"][-1]["content"] if data["messages"][-1]["role"] == "assistant" else ""
+                    }
+                    break
+
+
 def load_test_prompts(test_file: str, num_prompts: int) -> list[dict]:
     """Load prompts from test JSONL file (supports both formats)"""
-    prompts = []
-
     with open(test_file, "r") as f:
-        for line in f:
-            if len(prompts) >= num_prompts:
-                break
-
-            data = json.loads(line)
-            # Format 1: {"prompt": ..., "response": ...}
-            if "prompt" in data:
-                prompts.append({
-                    "prompt": data["prompt"],
-                    "expected": data.get("response", "")
-                })
-            # Format 2: {"messages": [{"role": "user", "content": ...}, ...]}
-            elif "messages" in data:
-                for msg in data["messages"]:
-                    if msg["role"] == "user":
-                        prompts.append({
-                            "prompt": msg["content"],
-                            "expected": data["messages"][-1]["content"] if data["messages"][-1]["role"] == "assistant" else ""
-                        })
-                        break
-
-    return prompts
-
-
-def create_preference_pairs(candidates: list[DomainCandidate]) -> list[tuple]:
-    """Create preference pairs from scored candidates"""
-    pairs = []
-
-    # Sort by score
-    sorted_candidates = sorted(candidates, key=lambda x: x.combined_score, reverse=True)
-
-    # Create pairs: best vs rest
-    if len(sorted_candidates) >= 2:
-        best = sorted_candidates[0]
-        for other in sorted_candidates[1:]:
-            # Only create pair if score difference is meaningful (> 0.5)
-            if best.combined_score - other.combined_score > 0.5:
-                pairs.append((best, other))
-
-    return pairs
+        # islice stops reading the file as soon as enough prompts are found
+        return list(islice(iter_test_prompts(f), num_prompts))
+
+
+def create_preference_pairs(
+    candidates: list[DomainCandidate],
+    max_pairs: Optional[int] = None,
+    margin: float = 0.5
+) -> list[tuple]:
+    """
+    Create preference pairs from scored candidates: the best candidate
+    against the max_pairs lowest-scoring ones (all of them if None), widest
+    score gap first. A pair is only made if the gap exceeds margin.
+    Candidates no judge scored are left out: their neutral scores are
+    placeholders, not a ranking.
+    """
+    candidates = [candidate for candidate in candidates if candidate.scored]
+    if len(candidates) < 2:
+        return []
+
+    # Best vs bottom-K: one max() and a partial heap select, no full sort
+    score = attrgetter("combined_score")
+    best = max(candidates, key=score)
+    rejected = [
+        other for other in candidates
+        if other is not best and best.combined_score - other.combined_score > margin
+    ]
+    if max_pairs is not None:
+        rejected = heapq.nsmallest(max_pairs, rejected, key=score)
+    else:
+        rejected.sort(key=score)
+
+    return [(best, other) for other in rejected]
 
 
 async def main():
@@ -314,6 +451,16 @@ async def main():
     parser.add_argument("--model_responses_file", help="Pre-generated model responses JSONL")
     parser.add_argument("--judge", default="both", choices=["both", "minimax", "deepseek"],
                         help="Which judge to use")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Max prompts scored at once (lower this if the API rate-limits)")
+    parser.add_argument("--pairs_per_prompt", type=int, default=None,
+                        help="Pair the best candidate with at most this many of the lowest-scoring ones "
+                             "(default: all that clear --min_score_gap)")
+    parser.add_argument("--min_score_gap", type=float, default=0.5,
+                        help="Minimum chosen-rejected score difference for a pair")
+    parser.add_argument("--judge_cache", default="rlhf/judge_cache",
+                        help="On-disk cache of judge scores, reused across runs (\"\" to disable). "
+                             "Scores from an older JUDGE_PROMPT_TEMPLATE are not reused")
     args = parser.parse_args()
 
     api_key = os.environ.get("OPENROUTER_API_KEY")
@@ -355,72 +502,116 @@ async def main():
         active_judges = {args.judge: JUDGES[args.judge]}
     print(f"  Using judges: {list(active_judges.keys())}")
 
-    # Process prompts
-    all_pairs = []
-
-    async with httpx.AsyncClient() as client:
-        for item in tqdm(prompts, desc="Processing prompts"):
-            prompt = item["prompt"]
-
-            # Get candidate domains - use pre-loaded responses or expected
-            if "responses" in item:
-                candidates_text = item["responses"]
-            elif prompt in model_responses:
-                candidates_text = model_responses[prompt]
-            elif item.get("expected"):
-                candidates_text = [item["expected"]]
-            else:
-                continue
-
-            # Extract domain names from responses
-            all_domains = []
-            for resp in candidates_text:
-                domains = extract_domains_from_response(resp)
-                all_domains.extend(domains)
-
-            # Deduplicate and limit
-            all_domains = list(set(all_domains))[:args.candidates_per_prompt * 2]
+    # Process prompts concurrently; the semaphore caps how many prompts
+    # are being judged at once (each prompt is one call per judge)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    progress = tqdm(total=len(prompts), desc="Processing prompts")
+
+    async def process_prompt(client, item, f) -> None:
+        prompt = item["prompt"]
+
+        # Get candidate domains - use pre-loaded responses or expected
+        if "responses" in item:
+            candidates_text = item["responses"]
+        elif prompt in model_responses:
+            candidates_text = model_responses[prompt]
+        elif item.get("expected"):
+            candidates_text = [item["expected"]]
+        else:
+            progress.update(1)
+            return
+
+        # Extract domain names from responses
+        all_domains = []
+        for resp in candidates_text:
+            domains = extract_domains_from_response(resp)
+            all_domains.extend(domains)
+
+        # Drop malformed candidates before they cost judge calls, then
+        # deduplicate (case-insensitively, keeping first-seen order so re-runs
+        # pick the same candidates and hit the judge cache) and limit
+        all_domains = list(dict.fromkeys(
+            domain.lower() for domain in all_domains if is_judgeable(domain)
+        ))[:args.candidates_per_prompt * 2]
+
+        if len(all_domains) < 2:
+            progress.update(1)
+            return
+
+        # Score all candidates with hybrid judges
+        async with semaphore:
+            scored_candidates = await score_candidates(
+                client, prompt, all_domains, active_judges, cache
+            )
+
+        # Create preference pairs
+        pairs = create_preference_pairs(scored_candidates, args.pairs_per_prompt, args.min_score_gap)
+        progress.update(1)
+
+        # Tasks only interleave at awaits, so each write is a whole line
+        for chosen, rejected in pairs:
+            pair = asdict(PreferencePair(
+                prompt=prompt,
+                chosen=chosen.domain,
+                rejected=rejected.domain,
+                chosen_score=chosen.combined_score,
+                rejected_score=rejected.combined_score
+            ))
+            f.write(json.dumps(pair) + "\n")
 
-            if len(all_domains) < 2:
-                continue
+            # Reservoir sample of one, for the summary below
+            stats["num_pairs"] += 1
+            if random.randrange(stats["num_pairs"]) == 0:
+                stats["sample"] = pair
+
+    # One client for the whole run: connections are pooled and kept alive
+    # (enough for every in-flight judge call), and the headers and timeout
+    # are set once instead of per request
+    client = httpx.AsyncClient(
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://domain-search-mcp.com",
+            "X-Title": "Domain Name Evaluator",
+        },
+        timeout=httpx.Timeout(60.0, connect=5.0),  # Long read timeout for slower models
+        limits=httpx.Limits(
+            max_connections=args.concurrency * len(active_judges),
+            max_keepalive_connections=args.concurrency * len(active_judges),
+        ),
+    )
 
-            # Score each candidate with hybrid judges
-            scored_candidates = []
-            for domain in all_domains:
-                candidate = await score_candidate(client, prompt, domain, api_key, active_judges)
-                scored_candidates.append(candidate)
-
-                # Rate limiting - longer delay for rate limit issues
-                await asyncio.sleep(1.0)
-
-            # Create preference pairs
-            pairs = create_preference_pairs(scored_candidates)
-
-            for chosen, rejected in pairs:
-                pair = PreferencePair(
-                    prompt=prompt,
-                    chosen=chosen.domain,
-                    rejected=rejected.domain,
-                    chosen_score=chosen.combined_score,
-                    rejected_score=rejected.combined_score
-                )
-                all_pairs.append(asdict(pair))
-
-    # Save results
+    # Pairs are written as each prompt finishes (line-buffered), so a crash
+    # keeps everything scored so far
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(output_path, "w") as f:
-        for pair in all_pairs:
-            f.write(json.dumps(pair) + "\n")
+    # Judge scores keyed by (model, prompt, domain): a re-run only pays for
+    # candidates that were not scored before
+    if args.judge_cache:
+        Path(args.judge_cache).parent.mkdir(parents=True, exist_ok=True)
+        cache = shelve.open(args.judge_cache)
+        print(f"  Judge cache: {args.judge_cache} ({len(cache)} scores)")
+    else:
+        cache = {}
 
-    print(f"\nGenerated {len(all_pairs)} preference pairs")
+    stats = {"num_pairs": 0, "sample": None}
+    try:
+        with open(output_path, "w", buffering=1) as f:
+            async with client:
+                await asyncio.gather(*(process_prompt(client, item, f) for item in prompts))
+    finally:
+        if args.judge_cache:
+            cache.close()
+    progress.close()
+
+    print(f"\nGenerated {stats['num_pairs']} preference pairs")
     print(f"Saved to: {output_path}")
 
     # Print sample
-    if all_pairs:
+    sample = stats["sample"]
+    if sample:
         print("\nSample preference pair:")
-        sample = random.choice(all_pairs)
         print(f"  Prompt: {sample['prompt'][:80]}...")
         print(f"  Chosen: {sample['chosen']} (score: {sample['chosen_score']:.2f})")
         print(f"  Rejected: {sample['rejected']} (score: {sample['rejected_score']:.2f})")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Merge the SFT LoRA adapter into full-precision base weights.
+
+The merged checkpoint can be served directly (no PEFT adapter routing, no
+NF4 dequant), e.g. by generate_model_responses.py --backend vllm
+--merged_model. Run once per adapter.
+
+Usage (on RunPod):
+    python merge_adapter.py \
+        --model_path /workspace/training/output-full \
+        --output /workspace/training/output-merged
+"""
+
+import argparse
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from peft import PeftModel
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", required=True, help="Path to SFT LoRA adapter")
+    parser.add_argument("--base_model", default="Qwen/Qwen2.5-7B-Instruct")
+    parser.add_argument("--output", required=True, help="Output directory for merged model")
+    args = parser.parse_args()
+
+    # Merge into bf16 weights: merging into a 4-bit base would bake the
+    # quantization error into the saved checkpoint
+    print(f"Loading base model: {args.base_model}")
+    model = AutoModelForCausalLM.from_pretrained(
+        args.base_model,
+        torch_dtype=torch.bfloat16,
+        device_map="auto",
+        trust_remote_code=True,
+    )
+
+    print(f"Merging LoRA adapter from: {args.model_path}")
+    model = PeftModel.from_pretrained(model, args.model_path)
+    model = model.merge_and_unload()
+
+    print(f"Saving merged model to: {args.output}")
+    model.save_pretrained(args.output, safe_serialization=True)
+    tokenizer = AutoTokenizer.from_pretrained(args.base_model, trust_remote_code=True)
+    tokenizer.save_pretrained(args.output)
+
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,7 +26,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from eval.constraint_satisfaction import evaluate_batch as eval_constraints, check_constraints
-from eval.diversity_metrics import evaluate_batch as eval_diversity, evaluate_cross_batch_diversity, parse_domain_names
+from eval.diversity_metrics import evaluate_batch_with_names as eval_diversity_with_names, evaluate_cross_batch_diversity
 from eval.pronounceability import evaluate_batch as eval_pronounceability
 from eval.premium_score import evaluate_batch as eval_premium
 
@@ -47,19 +47,20 @@ def load_dataset(name: str) -> list[dict]:
         print("Run split_dataset.py first to create train/val/test splits.")
         sys.exit(1)
 
-    data = []
+    # One reused decoder skips json.loads' per-call argument checks
+    decode = json.JSONDecoder().decode
     with open(path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                data.append(json.loads(line))
+        return [decode(line) for line in f if not line.isspace()]
 
-    return data
 
-
-def evaluate_dataset(samples: list[dict], name: str = "dataset") -> dict:
+def evaluate_dataset(samples: list[dict], name: str = "dataset", workers: int | None = None) -> dict:
     """
     Run all evaluation metrics on a dataset.
     Returns comprehensive metrics.
+
+    `workers` goes to each metric's evaluate_batch(), which spreads the
+    samples over that many processes (None: one per CPU for large
+    datasets; 1: serial).
     """
     print(f"\n{'='*60}")
     print(f"Evaluating: {name} ({len(samples):,} samples)")
@@ -73,20 +74,18 @@ def evaluate_dataset(samples: list[dict], name: str = "dataset") -> dict:
 
     # 1. Constraint Satisfaction
     print("\n[1/4] Evaluating constraint satisfaction...")
-    constraint_results = eval_constraints(samples)
+    constraint_results = eval_constraints(samples, workers)
     results["constraints"] = constraint_results
     print(f"  Overall: {constraint_results['avg_overall']:.3f}")
 
     # 2. Diversity Metrics
     print("\n[2/4] Evaluating diversity...")
-    diversity_results = eval_diversity(samples)
+    # The names for the cross-batch pass come out of the same parse
+    diversity_results, all_names = eval_diversity_with_names(samples, workers)
     results["diversity"] = diversity_results
     print(f"  Overall: {diversity_results['avg_overall']:.3f}")
 
     # Cross-batch diversity (check for repetitive patterns across all samples)
-    all_names = []
-    for sample in samples:
-        all_names.extend(parse_domain_names(sample['response']))
     cross_diversity = evaluate_cross_batch_diversity(all_names)
     results["cross_batch_diversity"] = {
         "total_names": cross_diversity["total_names"],
@@ -97,13 +96,13 @@ def evaluate_dataset(samples: list[dict], name: str = "dataset") -> dict:
 
     # 3. Pronounceability
     print("\n[3/4] Evaluating pronounceability...")
-    pronounce_results = eval_pronounceability(samples)
+    pronounce_results = eval_pronounceability(samples, workers)
     results["pronounceability"] = pronounce_results
     print(f"  Overall: {pronounce_results['avg_overall']:.3f}")
 
     # 4. Premium/Brandability Score
     print("\n[4/4] Evaluating brandability...")
-    premium_results = eval_premium(samples)
+    premium_results = eval_premium(samples, workers)
     results["premium"] = premium_results
     print(f"  Overall: {premium_results['avg_overall']:.3f}")
 
@@ -187,6 +186,9 @@ def main():
                         help="Compare two result files")
     parser.add_argument("--sample", type=int, default=0,
                         help="Only evaluate N random samples (for quick testing)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes per metric (default: one per CPU for large datasets; "
+                             "1 = serial, easier to debug)")
 
     args = parser.parse_args()
 
@@ -213,7 +215,7 @@ def main():
         name = f"{name}_sample{args.sample}"
 
     # Evaluate
-    results = evaluate_dataset(samples, name)
+    results = evaluate_dataset(samples, name, args.workers)
 
     # Save results
     output_name = args.output or f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
@@ -8,7 +8,6 @@ Splits the 100k dataset into:
 - test.jsonl (10k)  - For final evaluation (never seen during training)
 """
 
-import json
 import random
 from pathlib import Path
 
@@ -25,31 +24,33 @@ TEST_RATIO = 0.1    # 10k
 SEED = 42
 
 
-def load_dataset(path: Path) -> list[dict]:
-    """Load JSONL dataset."""
-    data = []
-    with open(path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                data.append(json.loads(line))
-    return data
+def load_lines(path: Path) -> list[bytes]:
+    """Read the non-blank lines of a JSONL file as raw, newline-terminated bytes."""
+    with open(path, 'rb') as f:
+        lines = [line for line in f if not line.isspace()]
+    if lines and not lines[-1].endswith(b'\n'):
+        lines[-1] += b'\n'
+    return lines
 
 
-def save_dataset(data: list[dict], path: Path):
-    """Save dataset as JSONL."""
-    with open(path, 'w', encoding='utf-8') as f:
-        for item in data:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    print(f"Saved {len(data):,} samples to {path}")
+def save_lines(lines: list[bytes], path: Path):
+    """Save raw JSONL lines."""
+    with open(path, 'wb') as f:
+        f.writelines(lines)
+    print(f"Saved {len(lines):,} samples to {path}")
 
 
 def split_dataset():
     """Split dataset into train/val/test."""
+    # Splitting only reorders samples, so lines are moved as raw bytes:
+    # nothing is parsed or re-serialized
     print(f"Loading dataset from {SOURCE_FILE}...")
-    data = load_dataset(SOURCE_FILE)
+    data = load_lines(SOURCE_FILE)
     print(f"Loaded {len(data):,} samples")
 
-    # Shuffle with seed for reproducibility
+    # Shuffle with seed for reproducibility. The permutation depends only on
+    # the seed and the sample count, so the splits match the ones made when
+    # this shuffled parsed dicts.
     random.seed(SEED)
     random.shuffle(data)
 
@@ -72,9 +73,9 @@ def split_dataset():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
     # Save splits
-    save_dataset(train_data, DATA_DIR / "train.jsonl")
-    save_dataset(val_data, DATA_DIR / "val.jsonl")
-    save_dataset(test_data, DATA_DIR / "test.jsonl")
+    save_lines(train_data, DATA_DIR / "train.jsonl")
+    save_lines(val_data, DATA_DIR / "val.jsonl")
+    save_lines(test_data, DATA_DIR / "test.jsonl")
 
     print("\nDone! Dataset split complete.")
     print(f"Files saved to: {DATA_DIR}")
@@ -4,77 +4,173 @@ Test fine-tuned Qwen model for domain name generation.
 """
 
 import argparse
+import json
+from pathlib import Path
+
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StaticCache, TextStreamer
 from peft import PeftModel
 
-
-def test_model(model_path: str, prompt: str, max_length: int = 512):
-    """Load and test the fine-tuned model."""
+from attention import pick_attn_implementation
+
+DEFAULT_PROMPT = "Generate 5 brandable domain names for an AI code assistant product. Style: technical, modern. Length 6-12 characters. Use TLDs: .ai, .dev. Provide a short reason for each name."
+
+
+def quantize_int4(model) -> bool:
+    """
+    Quantize the model's linear weights to int4 in place with torchao
+    (activations stay bf16). Returns False, leaving the model in bf16, when
+    torchao is not installed or the GPU predates the int4 kernels (sm80).
+    """
+    if not torch.cuda.is_available() or torch.cuda.get_device_capability() < (8, 0):
+        print("int4 needs an Ampere or newer GPU; staying in bf16")
+        return False
+    try:
+        from torchao.quantization import quantize_, int4_weight_only
+    except ImportError:
+        print("torchao is not installed; staying in bf16")
+        return False
+
+    quantize_(model, int4_weight_only(group_size=128))
+    return True
+
+
+def test_model(
+    model_path: str,
+    prompts: list[str],
+    max_length: int = 512,
+    compile_model: bool = False,
+    quant: str = "bf16",
+):
+    """
+    Load and test the fine-tuned model.
+
+    All prompts go through one batched generate call, left-padded so each
+    row's generation starts right after its prompt.
+
+    compile_model runs the forward pass through torch.compile. A short
+    warmup generate traces the prefill and the one-token decode step (and
+    captures the decode CUDA graph) before the timed one.
+    quant="int4" stores the weights as int4 (see quantize_int4()).
+    """
 
     print("=" * 60)
     print("Loading fine-tuned model...")
     print("=" * 60)
     print(f"Model path: {model_path}")
-    print(f"Prompt: {prompt}")
+    for prompt in prompts:
+        print(f"Prompt: {prompt}")
     print("")
 
     # Load tokenizer
     tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
 
     # Load base model + LoRA adapters
     print("Loading model (this may take a minute)...")
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        device_map="auto",
-        torch_dtype=torch.bfloat16,
-    )
+    adapter_config_path = Path(model_path) / "adapter_config.json"
+    if adapter_config_path.exists():
+        with open(adapter_config_path) as f:
+            base_model = json.load(f)["base_model_name_or_path"]
+        print(f"Base model: {base_model}")
+        model = AutoModelForCausalLM.from_pretrained(
+            base_model,
+            device_map="auto",
+            torch_dtype=torch.bfloat16,
+            attn_implementation=pick_attn_implementation(static_cache=compile_model),
+        )
+        model = PeftModel.from_pretrained(model, model_path)
+        # Fold the LoRA deltas into the base weights: one matmul per
+        # projection at inference instead of base + adapter
+        model = model.merge_and_unload()
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            model_path,
+            device_map="auto",
+            torch_dtype=torch.bfloat16,
+            attn_implementation=pick_attn_implementation(static_cache=compile_model),
+        )
 
-    # Prepare messages
-    messages = [
-        {"role": "user", "content": prompt}
-    ]
+    # Decode is bound by weight reads; int4 weights cut them ~4x vs bf16
+    int4 = quant == "int4" and quantize_int4(model)
+
+    if compile_model:
+        # max-autotune lets Inductor pick the tuned int4 matmul kernels
+        mode = "max-autotune" if int4 else "reduce-overhead"
+        model.forward = torch.compile(model.forward, mode=mode, fullgraph=False)
 
     # Tokenize
-    text = tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True,
-    )
+    texts = [
+        tokenizer.apply_chat_template(
+            [{"role": "user", "content": prompt}],
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        for prompt in prompts
+    ]
 
-    inputs = tokenizer([text], return_tensors="pt").to(model.device)
+    inputs = tokenizer(texts, return_tensors="pt", padding=True).to(model.device)
+    prompt_len = inputs["input_ids"].shape[1]
+
+    cache = None
+    if compile_model:
+        # A static KV cache keeps decode-step shapes fixed, so the compiled
+        # forward (and its CUDA graphs) is replayed for every token. It is
+        # sized for the real run up front: a cache allocated by the warmup
+        # would be too short and the real generate would recompile.
+        cache = StaticCache(
+            config=model.config,
+            max_batch_size=len(texts),
+            max_cache_len=prompt_len + max_length,
+            device=model.device,
+            dtype=torch.bfloat16,
+        )
+        # 3 tokens = prefill + 2 decode steps: the first decode step compiles
+        # and warms up, the second records the CUDA graph the real run replays
+        print("\nCompiling model (warmup)...")
+        with torch.no_grad():
+            model.generate(
+                **inputs, max_new_tokens=3, past_key_values=cache, pad_token_id=tokenizer.pad_token_id
+            )
+        cache.reset()
 
     # Generate
-    print("\nGenerating response...")
+    print("\nGenerating response(s)...")
     print("-" * 60)
 
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=max_length,
-            temperature=0.7,
-            top_p=0.9,
-            do_sample=True,
-            pad_token_id=tokenizer.pad_token_id,
-            eos_token_id=tokenizer.eos_token_id,
-        )
-
-    # Decode
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    gen_kwargs = dict(
+        **inputs,
+        max_new_tokens=max_length,
+        past_key_values=cache,
+        temperature=0.7,
+        top_p=0.9,
+        do_sample=True,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
 
-    # Extract assistant response (after the prompt)
-    if "<|im_start|>assistant" in response:
-        assistant_response = response.split("<|im_start|>assistant")[-1].strip()
-        if "<|im_end|>" in assistant_response:
-            assistant_response = assistant_response.split("<|im_end|>")[0].strip()
+    if len(prompts) == 1:
+        # Stream a single response: text is printed as tokens are decoded,
+        # not after the last one (transformers' streamers handle batch size 1
+        # only). TextStreamer prints from inside generate, on this thread, so
+        # the compiled model's CUDA graphs are replayed where they were captured
+        streamer = TextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        with torch.no_grad():
+            model.generate(**gen_kwargs, streamer=streamer)
+        print("-" * 60)
     else:
-        # Fallback: remove the input prompt
-        assistant_response = response[len(text):].strip()
+        with torch.no_grad():
+            outputs = model.generate(**gen_kwargs)
 
-    print(assistant_response)
-    print("-" * 60)
+        # Decode only the generated tokens; the (left-padded) prompt comes first
+        responses = tokenizer.batch_decode(outputs[:, prompt_len:], skip_special_tokens=True)
+
+        for prompt, response in zip(prompts, responses):
+            print(f"[{prompt}]")
+            print(response.strip())
+            print("-" * 60)
     print("\n✓ Generation complete!")
     print("=" * 60)
 
@@ -88,8 +184,9 @@ def main():
     )
     parser.add_argument(
         "--prompt",
-        default="Generate 5 brandable domain names for an AI code assistant product. Style: technical, modern. Length 6-12 characters. Use TLDs: .ai, .dev. Provide a short reason for each name.",
-        help="Prompt for domain generation",
+        action="append",
+        dest="prompts",
+        help="Prompt for domain generation; repeat it to generate for several prompts in one batch",
     )
     parser.add_argument(
         "--max_length",
@@ -97,10 +194,21 @@ def main():
         default=512,
         help="Maximum generation length",
     )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="torch.compile the model (slow start, faster decode)",
+    )
+    parser.add_argument(
+        "--quant",
+        choices=["bf16", "int4"],
+        default="bf16",
+        help="Weight precision; int4 needs torchao and an Ampere+ GPU",
+    )
 
     args = parser.parse_args()
 
-    test_model(args.model_path, args.prompt, args.max_length)
+    test_model(args.model_path, args.prompts or [DEFAULT_PROMPT], args.max_length, args.compile, args.quant)
 
 
 if __name__ == "__main__":